@@ -8,30 +8,65 @@ PyQt5 Collaborative Memo Board - Client Template
 - HELLO -> SUBSCRIBE -> (선택) GET_SNAPSHOT 흐름
 - 서버 이벤트(WELCOME/DOC_SNAPSHOT/APPLIED/BROADCAST/ERROR) 수신 및 적용
 - 로컬 편집 이벤트 → 간단 diff → INSERT/DELETE/REPLACE 생성 → base(version) 포함 전송
-- Out-of-date 수신 시 스냅샷 재요청 후 재시도(간단 전략)
+- 미확정 로컬 패치는 대기열에 보관, 원격 패치와 OT(오프셋 보정)로 맞춘 뒤 하나씩 전송
+- Out-of-date 수신 시 빠진 연산만(GET_OPS) 받아 보정 후 재전송, 불가하면 스냅샷 재동기화
 
 TODO(필요시 확장)
 - 인증 토큰 붙이기
-- 재시도 큐/미발신 보관
-- 간단 OT(오프셋 보정) 로직 추가
 - 다문서 탭/권한/리치 텍스트 등
 """
 
 import sys
 import socket
 import json
-import threading
 import time
 from dataclasses import dataclass
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List
 
-from PyQt5 import QtCore, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+try:
+    import orjson
+except ImportError:  # orjson 미설치 시 표준 json 모듈 사용
+    orjson = None
+
+
+RX_BUFFER_SIZE = 65536  # 수신 버퍼 기본 크기 (한 줄이 더 길면 자동 확장)
+ROPE_CHUNK_SIZE = 4096  # 텍스트 캐시 로프 청크 최대 글자 수
+EDIT_FLUSH_MS = 25  # 로컬 편집을 모아 보내는 지연 시간(ms)
+# 전송 중인 패치가 거절됐음을 뜻하는 서버 오류 (보정 불가 → 스냅샷 재동기화)
+PATCH_ERROR_CODES = {"INVALID_RANGE", "INVALID_PAYLOAD", "INVALID_OP", "INVALID_PATCH"}
+
+# 표준 json 경로용 인코더/디코더는 한 번만 만들어 재사용 (json.dumps/loads는 호출마다 생성)
+# 서버 encode_message와 동일하게 공백 없는 구분자 + 비ASCII(한글) 원문 그대로 전송
+_ENCODE = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+_DECODE = json.JSONDecoder().decode
+
+
+def encode_line(obj: Dict[str, Any]) -> bytes:
+    """메시지를 JSON line 바이트로 직렬화 (orjson 우선)."""
+    if orjson is not None:
+        return orjson.dumps(obj) + b"\n"
+    return (_ENCODE(obj) + "\n").encode("utf-8")
+
+
+def decode_line(line: bytes) -> Any:
+    """JSON line 바이트를 파싱 (orjson은 bytes를 직접 받으므로 decode 생략)."""
+    if orjson is not None:
+        return orjson.loads(line)
+    return _DECODE(line.decode("utf-8"))
 
 
 # =====================
 # 네트워크 워커
 # =====================
 class NetWorker(QtCore.QObject):
+    """Qt 이벤트 루프에서 동작하는 소켓 래퍼.
+
+    별도 스레드 없이 QSocketNotifier로 읽기/쓰기 가능 시점을 받아
+    논블로킹 소켓을 처리하므로, 수신 이벤트는 GUI 스레드에서 바로 전달된다.
+    """
+
     connected = QtCore.pyqtSignal()
     disconnected = QtCore.pyqtSignal()
     error = QtCore.pyqtSignal(str)
@@ -41,11 +76,18 @@ class NetWorker(QtCore.QObject):
     def __init__(self):
         super().__init__()
         self._sock: Optional[socket.socket] = None
-        self._reader_thread: Optional[threading.Thread] = None
-        self._writer_lock = threading.Lock()
+        self._read_notifier: Optional[QtCore.QSocketNotifier] = None
+        self._write_notifier: Optional[QtCore.QSocketNotifier] = None
         self._alive = False
         self._host = None
         self._port = None
+        # 수신 버퍼를 한 번만 할당해 recv_into로 재사용 (recv마다 bytes 생성/복사 방지)
+        self._rxbuf = bytearray(RX_BUFFER_SIZE)
+        self._rxview = memoryview(self._rxbuf)
+        self._rx_start = 0  # 아직 처리하지 않은 줄의 시작
+        self._rx_end = 0  # 수신된 바이트의 끝
+        # 송신 대기열: 같은 이벤트 루프 틱에 쌓인 메시지를 한 번에 전송
+        self._outq = bytearray()
 
     def connect_to(self, host: str, port: int, timeout=5.0) -> bool:
         if self._alive:
@@ -56,12 +98,20 @@ class NetWorker(QtCore.QObject):
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.settimeout(timeout)
             s.connect((host, port))
-            s.settimeout(None)
+            # 이후 읽기/쓰기는 이벤트 루프에서 논블로킹으로 처리
+            s.setblocking(False)
+            # 송신을 직접 묶어 보내므로 Nagle 지연은 끔
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self._sock = s
             self._alive = True
             self._host, self._port = host, port
-            self._reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
-            self._reader_thread.start()
+            self._rx_start = self._rx_end = 0
+            self._read_notifier = QtCore.QSocketNotifier(s.fileno(), QtCore.QSocketNotifier.Read, self)
+            self._read_notifier.activated.connect(self._on_readable)
+            # 쓰기 알림은 소켓 버퍼가 가득 차 다 못 보낸 데이터가 있을 때만 켬
+            self._write_notifier = QtCore.QSocketNotifier(s.fileno(), QtCore.QSocketNotifier.Write, self)
+            self._write_notifier.setEnabled(False)
+            self._write_notifier.activated.connect(self._on_writable)
             self.connected.emit()
             self.status.emit("Connected")
             return True
@@ -73,6 +123,12 @@ class NetWorker(QtCore.QObject):
 
     def close(self):
         self._alive = False
+        self._outq.clear()
+        for notifier in (self._read_notifier, self._write_notifier):
+            if notifier is not None:
+                notifier.setEnabled(False)
+                notifier.deleteLater()
+        self._read_notifier = self._write_notifier = None
         if self._sock:
             try:
                 self._sock.shutdown(socket.SHUT_RDWR)
@@ -86,44 +142,145 @@ class NetWorker(QtCore.QObject):
         self.disconnected.emit()
         self.status.emit("Disconnected")
 
-    def _reader_loop(self):
-        buf = b""
+    @QtCore.pyqtSlot(int)
+    def _on_readable(self, _fd: int = -1):
+        sock = self._sock
+        if not self._alive or not sock:
+            return
+        rxbuf = self._rxbuf
+        start, write_pos = self._rx_start, self._rx_end
+        if write_pos == len(rxbuf):
+            if start:
+                # 처리 완료 구간을 앞으로 당겨 공간 확보
+                rem = write_pos - start
+                rxbuf[:rem] = rxbuf[start:write_pos]
+                start, write_pos = 0, rem
+            else:
+                # 버퍼보다 긴 한 줄 → 두 배로 확장 (export 중인 view는 먼저 해제)
+                self._rxview.release()
+                rxbuf.extend(bytes(len(rxbuf)))
+                self._rxview = memoryview(rxbuf)
         try:
-            while self._alive and self._sock:
-                chunk = self._sock.recv(4096)
-                if not chunk:
-                    break
-                buf += chunk
-                while b"\n" in buf:
-                    line, buf = buf.split(b"\n", 1)
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        msg = json.loads(line.decode("utf-8"))
-                        self.eventReceived.emit(msg)
-                    except Exception as e:
-                        self.error.emit(f"Bad JSON: {e}")
-        except Exception as e:
+            n = sock.recv_into(self._rxview[write_pos:])
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
             self.error.emit(f"Reader error: {e}")
-        finally:
             self.close()
+            return
+        if not n:
+            self.close()
+            return
+        # 이미 검사한 구간은 다시 훑지 않도록 새로 받은 구간부터 개행 탐색
+        scan_start = write_pos
+        write_pos += n
+        lines = []
+        while True:
+            nl = rxbuf.find(b"\n", scan_start, write_pos)
+            if nl < 0:
+                break
+            line = rxbuf[start:nl]
+            start = scan_start = nl + 1
+            # json.loads는 앞뒤 공백을 허용하므로 strip 복사 없이 빈 줄만 건너뜀
+            if line and not line.isspace():
+                lines.append(line)
+        if start == write_pos:
+            start = write_pos = 0
+        elif start > len(rxbuf) // 2:
+            rem = write_pos - start
+            rxbuf[:rem] = rxbuf[start:write_pos]
+            start, write_pos = 0, rem
+        self._rx_start, self._rx_end = start, write_pos
+        # 버퍼 상태를 먼저 저장한 뒤 전달 (처리 중 close/재연결이 일어나도 안전)
+        for line in lines:
+            if not self._alive:
+                break
+            try:
+                msg = decode_line(line)
+            except Exception as e:
+                self.error.emit(f"Bad JSON: {e}")
+                continue
+            self.eventReceived.emit(msg)
 
     def send_json(self, obj: Dict[str, Any]):
         if not self._sock:
             self.error.emit("Not connected")
             return
-        data = (json.dumps(obj) + "\n").encode("utf-8")
-        with self._writer_lock:
-            try:
-                self._sock.sendall(data)
-            except Exception as e:
-                self.error.emit(f"Send failed: {e}")
+        schedule = not self._outq
+        self._outq += encode_line(obj)
+        if schedule:
+            # 다음 이벤트 루프 틱에서 한꺼번에 전송
+            QtCore.QMetaObject.invokeMethod(self, "_flush_out", QtCore.Qt.QueuedConnection)
+
+    @QtCore.pyqtSlot(int)
+    def _on_writable(self, _fd: int = -1):
+        self._flush_out()
+
+    @QtCore.pyqtSlot()
+    def _flush_out(self):
+        sock = self._sock
+        if not sock or not self._outq:
+            return
+        try:
+            sent = sock.send(self._outq)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError as e:
+            self.error.emit(f"Send failed: {e}")
+            self.close()
+            return
+        del self._outq[:sent]
+        # 남은 데이터는 소켓이 다시 쓰기 가능해질 때 이어서 전송
+        if self._write_notifier is not None:
+            self._write_notifier.setEnabled(bool(self._outq))
 
 
 # =====================
 # 간단 diff & 패치 적용 유틸
 # =====================
+DIFF_SCAN_BLOCK = 4096  # 공통 접두/접미 탐색 시 한 번에 비교할 최대 글자 수
+DIFF_EDGE_PROBE = 64  # 대량 치환 판단 시 비교할 앞/뒤 글자 수
+
+
+def _common_prefix_len(a: str, b: str, limit: int) -> int:
+    """a, b의 공통 접두 길이(최대 limit).
+
+    글자 단위 파이썬 루프 대신 블록 슬라이스 비교(C memcmp)로 전진하고,
+    어긋난 블록 안에서만 블록 크기를 절반씩 줄여 위치를 좁힌다.
+    """
+    i = 0
+    step = DIFF_SCAN_BLOCK
+    while step:
+        while i + step <= limit and a[i : i + step] == b[i : i + step]:
+            i += step
+        step //= 2
+    return i
+
+
+def _common_suffix_len(a: str, b: str, limit: int) -> int:
+    """a, b의 공통 접미 길이(최대 limit). 탐색 방식은 _common_prefix_len과 동일."""
+    la, lb = len(a), len(b)
+    k = 0
+    step = DIFF_SCAN_BLOCK
+    while step:
+        while k + step <= limit and a[la - k - step : la - k] == b[lb - k - step : lb - k]:
+            k += step
+        step //= 2
+    return k
+
+
+def find_diff_span(old: str, new: str) -> Tuple[int, int, int]:
+    """old/new가 달라지는 구간 (i, oi, nj)를 반환.
+
+    old[i:oi+1]이 new[i:nj+1]로 바뀐 것으로 본다. 두 스캔 모두 슬라이스
+    비교로 C 루프에서 돌기 때문에 별도 네이티브 확장 없이도 큰 문서에서 빠르다.
+    """
+    minlen = min(len(old), len(new))
+    i = _common_prefix_len(old, new, minlen)
+    suffix = _common_suffix_len(old, new, minlen - i)
+    return i, len(old) - 1 - suffix, len(new) - 1 - suffix
+
+
 @dataclass
 class Patch:
     type: str  # INSERT | DELETE | REPLACE
@@ -138,44 +295,222 @@ def compute_patch(old: str, new: str) -> Optional[Patch]:
     """
     if old == new:
         return None
-    i = 0
-    minlen = min(len(old), len(new))
-    while i < minlen and old[i] == new[i]:
-        i += 1
-    oi = len(old) - 1
-    nj = len(new) - 1
-    while oi >= i and nj >= i and old[oi] == new[nj]:
-        oi -= 1
-        nj -= 1
-
-    if len(new) > len(old):  # INSERT
-        ins_text = new[i : nj + 1]
+    if old and new and abs(len(new) - len(old)) > max(len(old), len(new)) // 2:
+        # 큰 붙여넣기/전체 치환: 앞뒤 끝이 모두 다르면 전체 스캔 없이 통째로 REPLACE
+        k = DIFF_EDGE_PROBE
+        if old[:k] != new[:k] and old[-k:] != new[-k:]:
+            return Patch("REPLACE", pos=0, length=len(old), text=new)
+    i, oi, nj = find_diff_span(old, new)
+
+    # 길이 차이만으로 판단하면 "1글자 선택 후 4글자 붙여넣기"가 INSERT로 잘못 분류되므로
+    # 실제로 지워진/추가된 구간 길이로 판단
+    del_len = oi - i + 1
+    ins_text = new[i : nj + 1]
+    if not del_len:  # INSERT
         return Patch("INSERT", pos=i, text=ins_text)
-    elif len(new) < len(old):  # DELETE
-        del_len = (oi - i + 1)
+    elif not ins_text:  # DELETE
         return Patch("DELETE", pos=i, length=del_len)
     else:  # REPLACE
-        rep_text = new[i : nj + 1]
-        rep_len = (oi - i + 1)
-        return Patch("REPLACE", pos=i, length=rep_len, text=rep_text)
+        return Patch("REPLACE", pos=i, length=del_len, text=ins_text)
+
 
+# QTextCursor.selectedText()의 구분자/nbsp를 toPlainText()와 같게 변환
+_PLAIN_TEXT_MAP = {0x2029: "\n", 0x2028: "\n", 0x00A0: " "}
 
-def apply_patch_to_text(content: str, patch: Dict[str, Any]) -> str:
+
+class Rope:
+    """최대 ROPE_CHUNK_SIZE 글자 청크로 텍스트를 보관 (server/doc.py의 Rope와 같은 구조).
+
+    _text_cache 갱신 시 편집 위치의 청크만 다시 만들어 문서 전체를 복사하지 않는다.
+    """
+
+    __slots__ = ("_chunks", "_length")
+
+    def __init__(self, text: str = ""):
+        self._chunks = _split_chunks(text)
+        self._length = len(text)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return "".join(self._chunks)
+
+    def __getitem__(self, key: slice) -> str:
+        start, stop, _ = key.indices(self._length)
+        if start >= stop:
+            return ""
+        idx, off = self._locate(start)
+        need = stop - start
+        parts = []
+        while need:
+            piece = self._chunks[idx][off : off + need]
+            parts.append(piece)
+            need -= len(piece)
+            idx += 1
+            off = 0
+        return "".join(parts)
+
+    def insert(self, pos: int, text: str) -> None:
+        if not text:
+            return
+        if not self._chunks:
+            self._chunks = _split_chunks(text)
+            self._length = len(text)
+            return
+        idx, off = self._locate(pos)
+        chunk = self._chunks[idx]
+        merged = chunk[:off] + text + chunk[off:]
+        if len(merged) <= ROPE_CHUNK_SIZE:
+            self._chunks[idx] = merged
+        else:
+            self._chunks[idx : idx + 1] = _split_chunks(merged)
+        self._length += len(text)
+
+    def delete(self, pos: int, length: int) -> None:
+        if length <= 0:
+            return
+        chunks = self._chunks
+        first, off = self._locate(pos)
+        idx = first
+        remaining = length
+        while remaining:
+            chunk = chunks[idx]
+            take = min(len(chunk) - off, remaining)
+            rest = chunk[:off] + chunk[off + take :]
+            remaining -= take
+            if rest:
+                chunks[idx] = rest
+                idx += 1
+            else:
+                del chunks[idx]
+            off = 0
+        self._length -= length
+        # 삭제로 작아진 청크는 이웃과 합쳐 청크 수가 늘어나지 않게 함
+        for i in (first, first - 1):
+            if 0 <= i < len(chunks) - 1 and len(chunks[i]) + len(chunks[i + 1]) <= ROPE_CHUNK_SIZE:
+                chunks[i : i + 2] = [chunks[i] + chunks[i + 1]]
+
+    def replace(self, pos: int, length: int, text: str) -> None:
+        self.delete(pos, length)
+        self.insert(pos, text)
+
+    def _locate(self, pos: int) -> Tuple[int, int]:
+        for idx, chunk in enumerate(self._chunks):
+            if pos <= len(chunk):
+                return idx, pos
+            pos -= len(chunk)
+        raise IndexError("rope position out of range")
+
+
+def _split_chunks(text: str):
+    return [text[i : i + ROPE_CHUNK_SIZE] for i in range(0, len(text), ROPE_CHUNK_SIZE)]
+
+
+def apply_patch_to_text(content: Rope, patch: Dict[str, Any]) -> Rope:
+    """서버 패치를 로프에 제자리 적용 (범위를 벗어난 값은 문서 경계로 보정)."""
     t = patch.get("type")
-    pos = int(patch.get("pos", 0))
+    pos = max(0, min(len(content), int(patch.get("pos", 0))))
     if t == "INSERT":
         tx = patch.get("text", "")
-        return content[:pos] + tx + content[pos:]
-    if t == "DELETE":
+        content.insert(pos, tx)
+    elif t == "DELETE":
         ln = int(patch.get("len") or patch.get("length", 0))
-        return content[:pos] + content[pos + ln :]
-    if t == "REPLACE":
+        content.delete(pos, min(ln, len(content) - pos))
+    elif t == "REPLACE":
         ln = int(patch.get("len") or patch.get("length", 0))
         tx = patch.get("text", "")
-        return content[:pos] + tx + content[pos + ln :]
+        content.replace(pos, min(ln, len(content) - pos), tx)
     return content
 
 
+# =====================
+# 간단 OT(오프셋 보정)
+# =====================
+def split_patch(patch: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """INSERT/DELETE/REPLACE 패치를 INSERT/DELETE 기본 연산 목록으로 분해.
+
+    REPLACE는 같은 위치의 DELETE 후 INSERT와 같다.
+    """
+    t = patch.get("type")
+    pos = int(patch.get("pos", 0))
+    ln = int(patch.get("len") or patch.get("length", 0)) if t in ("DELETE", "REPLACE") else 0
+    tx = patch.get("text", "") if t in ("INSERT", "REPLACE") else ""
+    ops: List[Dict[str, Any]] = []
+    if ln > 0:
+        ops.append({"type": "DELETE", "pos": pos, "len": ln})
+    if isinstance(tx, str) and tx:
+        ops.append({"type": "INSERT", "pos": pos, "text": tx})
+    return ops
+
+
+def join_patches(ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """DELETE 바로 뒤 같은 위치 INSERT를 REPLACE 하나로 합쳐 서버 연산 수를 줄임."""
+    out: List[Dict[str, Any]] = []
+    for op in ops:
+        prev = out[-1] if out else None
+        if prev and prev["type"] == "DELETE" and op["type"] == "INSERT" and op["pos"] == prev["pos"]:
+            out[-1] = {"type": "REPLACE", "pos": prev["pos"], "len": prev["len"], "text": op["text"]}
+        else:
+            out.append(op)
+    return out
+
+
+def _transform_one(a: Dict[str, Any], b: Dict[str, Any], a_first: bool) -> List[Dict[str, Any]]:
+    """같은 상태 기준 기본 연산 a를 b 적용 이후 상태 기준으로 보정.
+
+    같은 위치 삽입끼리는 a_first인 쪽이 앞에 온다. 삭제 구간 안에 상대 삽입이
+    들어오면 삽입된 글자를 남기도록 삭제를 앞/뒤 둘로 나눈다.
+    """
+    if a["type"] == "INSERT":
+        if b["type"] == "INSERT":
+            if a["pos"] < b["pos"] or (a["pos"] == b["pos"] and a_first):
+                return [a]
+            return [dict(a, pos=a["pos"] + len(b["text"]))]
+        b_end = b["pos"] + b["len"]
+        if a["pos"] <= b["pos"]:
+            return [a]
+        if a["pos"] >= b_end:
+            return [dict(a, pos=a["pos"] - b["len"])]
+        return [dict(a, pos=b["pos"])]
+
+    a_end = a["pos"] + a["len"]
+    if b["type"] == "INSERT":
+        added = len(b["text"])
+        if b["pos"] <= a["pos"]:
+            return [dict(a, pos=a["pos"] + added)]
+        if b["pos"] >= a_end:
+            return [a]
+        head = b["pos"] - a["pos"]
+        return [dict(a, len=head), {"type": "DELETE", "pos": a["pos"] + added, "len": a["len"] - head}]
+    b_end = b["pos"] + b["len"]
+    if a_end <= b["pos"]:
+        return [a]
+    if a["pos"] >= b_end:
+        return [dict(a, pos=a["pos"] - b["len"])]
+    remaining = a["len"] - (min(a_end, b_end) - max(a["pos"], b["pos"]))
+    if remaining <= 0:
+        return []
+    return [{"type": "DELETE", "pos": min(a["pos"], b["pos"]), "len": remaining}]
+
+
+def transform_ops(
+    xs: List[Dict[str, Any]], ys: List[Dict[str, Any]], x_first: bool
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """같은 상태 기준 연산열 xs, ys → (ys 이후 기준 xs', xs 이후 기준 ys')."""
+    if not xs or not ys:
+        return xs, ys
+    if len(xs) == 1 and len(ys) == 1:
+        return _transform_one(xs[0], ys[0], x_first), _transform_one(ys[0], xs[0], not x_first)
+    if len(xs) > 1:
+        head, ys1 = transform_ops(xs[:1], ys, x_first)
+        rest, ys2 = transform_ops(xs[1:], ys1, x_first)
+        return head + rest, ys2
+    xs1, head = transform_ops(xs, ys[:1], x_first)
+    xs2, rest = transform_ops(xs1, ys[1:], x_first)
+    return xs2, head + rest
+
+
 # =====================
 # 메인 윈도우
 # =====================
@@ -186,22 +521,32 @@ class MainWindow(QtWidgets.QMainWindow):
         self.resize(900, 600)
 
         self.worker = NetWorker()
-        self.thread = QtCore.QThread(self)
-        self.worker.moveToThread(self.thread)
-        self.thread.start()
 
         # 상태
         self.session_id: Optional[str] = None
         self.current_doc: str = "main"
         self.current_version: int = 0
-        self.applying_remote: bool = False  # 원격 적용 중에는 textChanged 무시
-        self.last_text_for_diff: str = ""
+        self.applying_remote: bool = False  # 원격 적용 중에는 contentsChange 무시
+        self._text_cache = Rope()  # 편집기 내용의 사본 (toPlainText 왕복 없이 diff/패치 기준)
         self.name: str = "user"
         self.doc_synced: bool = False
+        # 아직 전송하지 않은 로컬 편집 구간: 시작 위치 + 변경되지 않은 꼬리 길이
+        self._dirty_start: Optional[int] = None
+        self._dirty_tail: int = 0
+        # 서버 확인(APPLIED)을 기다리는 로컬 패치 대기열. 한 번에 [0]만 전송
+        self._outbox: List[Dict[str, Any]] = []
+        self._inflight: bool = False
+        self._awaiting_ops: bool = False  # GET_OPS 응답 대기 중에는 전송 보류
 
         # UI
         self._build_ui()
 
+        # 연속 입력을 EDIT_FLUSH_MS 동안 모아 패치 하나로 전송
+        self._flush_timer = QtCore.QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(EDIT_FLUSH_MS)
+        self._flush_timer.timeout.connect(self._flush_pending_edit)
+
         # 신호 연결
         self.worker.connected.connect(self.on_connected)
         self.worker.disconnected.connect(self.on_disconnected)
@@ -257,7 +602,7 @@ class MainWindow(QtWidgets.QMainWindow):
         # event bindings
         self.btn_connect.clicked.connect(self.ui_connect)
         self.btn_sub.clicked.connect(self.ui_subscribe)
-        self.text.textChanged.connect(self.on_text_changed)
+        self.text.document().contentsChange.connect(self.on_contents_change)
 
     def set_status(self, s: str):
         self.status.showMessage(s, 5000)
@@ -282,6 +627,7 @@ class MainWindow(QtWidgets.QMainWindow):
     def request_doc_sync(self):
         self.current_doc = self.ed_doc.text().strip() or "main"
         self.doc_synced = False
+        self._reset_pending()
         self.worker.send_json({"op": "SUBSCRIBE", "docId": self.current_doc})
         self.worker.send_json({"op": "GET_SNAPSHOT", "docId": self.current_doc})
         self.set_status(f"Syncing doc '{self.current_doc}' ...")
@@ -320,17 +666,32 @@ class MainWindow(QtWidgets.QMainWindow):
                 return
             ver = int(ev.get("version", 0))
             patch = ev.get("patch", {})
-            author = ev.get("by")
-            is_self_event = bool(author) and author == self.session_id and et == "APPLIED"
-            self.apply_remote_patch(patch, ver, from_self=is_self_event)
+            self.apply_remote_patch(patch, ver, author=ev.get("by"))
+
+        elif et == "OPS":
+            if ev.get("docId") != self.current_doc:
+                return
+            # 받은 연산을 모두 반영한 뒤에 대기 해제 (중간에 옛 base로 전송하지 않도록)
+            for entry in ev.get("ops") or []:
+                self.apply_remote_patch(entry.get("patch"), int(entry.get("version", 0)), author=entry.get("by"))
+            self._awaiting_ops = False
+            self._send_next()
 
         elif et == "ERROR":
             code = ev.get("code")
             if code == "OUT_OF_DATE":
-                # 최신 스냅샷 재요청
-                self.doc_synced = False
-                self.worker.send_json({"op": "GET_SNAPSHOT", "docId": self.current_doc})
-                self.set_status("Out-of-date → Resync snapshot")
+                # 전송 중이던 패치는 거절됨 → 빠진 연산만 받아 보정 후 재전송
+                self._inflight = False
+                server_version = ev.get("serverVersion")
+                if isinstance(server_version, int) and server_version > self.current_version:
+                    self._request_ops()
+                    self.set_status("Out-of-date → Fetch missing ops")
+                else:
+                    self._send_next()
+            elif code == "OPS_UNAVAILABLE" or (self._inflight and code in PATCH_ERROR_CODES):
+                # 서버 기록으로 보정할 수 없거나 패치가 어긋남 → 스냅샷으로 재동기화
+                self._resync_snapshot()
+                self.set_status(f"{code} → Resync snapshot")
             else:
                 self.set_status(f"Server ERROR: {code}")
 
@@ -338,107 +699,186 @@ class MainWindow(QtWidgets.QMainWindow):
             pass
 
     # ---------- 로컬 편집 → diff → 전송 ----------
-    @QtCore.pyqtSlot()
-    def on_text_changed(self):
+    @QtCore.pyqtSlot(int, int, int)
+    def on_contents_change(self, pos: int, removed: int, added: int):
+        """Qt가 알려주는 편집 구간만 기록하고 전송은 타이머로 미룸."""
         if self.applying_remote:
             return
-        new_text = self.text.toPlainText()
         if not self.doc_synced:
-            # 아직 스냅샷을 받지 못한 상태 → 편집 전송 보류
-            self.last_text_for_diff = new_text
+            # 아직 스냅샷을 받지 못한 상태 → 편집 전송 보류 (스냅샷이 덮어씀)
             return
-        patch = compute_patch(self.last_text_for_diff, new_text)
+        new_len = self.text.document().characterCount() - 1  # 마지막 문단 구분자 제외
+        # 구간 앞쪽과 뒤쪽 꼬리는 다음 편집이 와도 그대로이므로 둘만 누적하면 됨
+        tail = max(0, new_len - (pos + added))
+        if self._dirty_start is None:
+            self._dirty_start, self._dirty_tail = pos, tail
+        else:
+            self._dirty_start = min(self._dirty_start, pos)
+            self._dirty_tail = min(self._dirty_tail, tail)
+        self._flush_timer.start()
+
+    @QtCore.pyqtSlot()
+    def _flush_pending_edit(self):
+        """누적된 편집을 대기열에 넣고, 전송 중인 패치가 없으면 바로 전송."""
+        self._collect_pending_edit()
+        self._send_next()
+
+    def _collect_pending_edit(self):
+        """누적된 편집 구간을 diff하여 패치 하나로 대기열(_outbox)에 추가."""
+        self._flush_timer.stop()
+        if self._dirty_start is None:
+            return
+        pos, tail = self._dirty_start, self._dirty_tail
+        self._dirty_start, self._dirty_tail = None, 0
+        if not self.doc_synced:
+            return
+        old_text = self._text_cache
+        new_len = self.text.document().characterCount() - 1
+        # Qt는 문서 끝 구분자나 서식 갱신 때문에 실제보다 넓은 구간을 보고하기도 하므로
+        # 변경되지 않은 꼬리 길이로 구간을 다시 계산하고, 그 안에서만 diff로 좁힌다.
+        start = max(0, min(pos, len(old_text) - tail, new_len - tail))
+        old_end = len(old_text) - tail
+        new_segment = self._document_slice(start, new_len - tail)
+        patch = compute_patch(old_text[start:old_end], new_segment)
+        old_text.replace(start, old_end - start, new_segment)
         if not patch:
-            self.last_text_for_diff = new_text
             return
+        entry: Dict[str, Any] = {"type": patch.type, "pos": patch.pos + start}
+        if patch.type in ("DELETE", "REPLACE"):
+            entry["len"] = patch.length
+        if patch.type in ("INSERT", "REPLACE"):
+            entry["text"] = patch.text
+        self._outbox.append(entry)
+
+    def _send_next(self):
+        """대기열 맨 앞 패치를 현재 버전 기준으로 전송 (전송 중인 패치는 항상 하나)."""
+        if self._inflight or self._awaiting_ops or not self._outbox or not self.doc_synced:
+            return
+        entry = self._outbox[0]
         # base는 현재 로컬이 알고 있는 문서 버전
-        base = int(self.current_version)
-        msg = {"op": patch.type, "docId": self.current_doc, "base": base, "pos": patch.pos}
-        if patch.type == "INSERT":
-            msg["text"] = patch.text
-        elif patch.type == "DELETE":
-            msg["len"] = patch.length
-        elif patch.type == "REPLACE":
-            msg["len"] = patch.length
-            msg["text"] = patch.text
+        msg = {"op": entry["type"], "docId": self.current_doc, "base": int(self.current_version)}
+        msg.update((k, v) for k, v in entry.items() if k != "type")
+        self._inflight = True
         self.worker.send_json(msg)
-        # 서버의 APPLIED/BROADCAST로 최종 버전이 확정되면 그때 current_version 갱신
-        self.last_text_for_diff = new_text
+        # 서버의 APPLIED로 확정되면 대기열에서 빼고 다음 패치 전송
+
+    def _request_ops(self):
+        """current_version 이후 서버 연산만 요청 (스냅샷 전체 재전송 대신)."""
+        if self._awaiting_ops:
+            return
+        self._awaiting_ops = True
+        self.worker.send_json({"op": "GET_OPS", "docId": self.current_doc, "since": int(self.current_version)})
+
+    def _resync_snapshot(self):
+        self.doc_synced = False
+        self._reset_pending()
+        self.worker.send_json({"op": "GET_SNAPSHOT", "docId": self.current_doc})
+
+    def _reset_pending(self):
+        self._flush_timer.stop()
+        self._dirty_start, self._dirty_tail = None, 0
+        self._outbox.clear()
+        self._inflight = False
+        self._awaiting_ops = False
+
+    def _document_slice(self, start: int, end: int) -> str:
+        """문서의 [start, end) 구간을 toPlainText와 같은 규칙으로 읽음."""
+        if end <= start:
+            return ""
+        cursor = QtGui.QTextCursor(self.text.document())
+        cursor.setPosition(start)
+        cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+        return cursor.selectedText().translate(_PLAIN_TEXT_MAP)
 
     # ---------- 원격 적용 ----------
     def apply_remote_snapshot(self, content: str, version: int):
+        # 스냅샷이 문서를 통째로 덮어쓰므로 보류/미확정 로컬 편집은 버림
+        self._reset_pending()
         self.applying_remote = True
         try:
             self.text.blockSignals(True)
             self.text.setPlainText(content)
-            self.last_text_for_diff = content
+            self._text_cache = Rope(content)
         finally:
             self.text.blockSignals(False)
             self.applying_remote = False
-        self.current_version = version
-        self.lbl_version.setText(f"ver: {self.current_version}")
+        self._set_version(version)
         self.doc_synced = True
 
-    def apply_remote_patch(self, patch: Dict[str, Any], version: int, *, from_self: bool = False):
-        """서버 패치를 로컬 편집기에 반영."""
-        if from_self or not isinstance(patch, dict):
-            self.current_version = version
-            self.lbl_version.setText(f"ver: {self.current_version}")
-            self.doc_synced = True
+    def apply_remote_patch(self, patch: Dict[str, Any], version: int, *, author: Optional[str] = None):
+        """서버가 확정한 version의 패치를 반영.
+
+        자신의 패치면 대기열에서 확인 처리하고, 다른 세션 패치면 대기 중인
+        로컬 패치들과 서로 보정(OT)한 뒤 편집기에 적용한다.
+        """
+        if not self.doc_synced or version <= self.current_version:
+            return  # 스냅샷 대기 중이거나 이미 반영한 버전 (OPS/BROADCAST 중복 등)
+        if version > self.current_version + 1:
+            # 중간 버전을 놓침 → 빠진 연산만 요청
+            self._request_ops()
+            return
+        if author is not None and author == self.session_id:
+            if self._inflight and self._outbox:
+                self._outbox.pop(0)
+            self._inflight = False
+            self._set_version(version)
+            self._send_next()
+            return
+        if not isinstance(patch, dict):
+            self._set_version(version)
             return
 
-        current = self.text.toPlainText()
-        newc = apply_patch_to_text(current, patch)
-        cursor = self.text.textCursor()
-        new_cursor_pos = self._cursor_after_patch(cursor.position(), patch)
-        new_cursor_pos = max(0, min(len(newc), new_cursor_pos))
-
+        # 보류 중인 로컬 편집까지 대기열에 넣어 캐시를 문서와 맞춘 뒤 보정.
+        # 전송 중인 패치는 이 원격 패치 때문에 OUT_OF_DATE로 거절되므로 함께 보정해도 됨
+        self._collect_pending_edit()
+        remote = split_patch(patch)
+        outbox: List[Dict[str, Any]] = []
+        for entry in self._outbox:
+            remote, local = transform_ops(remote, split_patch(entry), True)
+            outbox.extend(join_patches(local))
+        self._outbox = outbox
+        for op in join_patches(remote):
+            self._apply_to_editor(op)
+        self._set_version(version)
+        # 보류 편집을 위에서 대기열로 옮겼으므로 (타이머 대신) 여기서 전송 시도
+        self._send_next()
+
+    def _apply_to_editor(self, patch: Dict[str, Any]) -> None:
+        apply_patch_to_text(self._text_cache, patch)
+        # 바뀐 구간만 커서로 편집하면 나머지 블록 레이아웃은 그대로이고,
+        # 사용자 커서/선택 영역도 Qt가 편집 위치에 맞춰 옮겨 주므로 따로 복원하지 않음
         self.applying_remote = True
         try:
-            self.text.blockSignals(True)
-            self.text.setPlainText(newc)
-            self.last_text_for_diff = newc
-            cursor = self.text.textCursor()
-            cursor.setPosition(new_cursor_pos)
-            self.text.setTextCursor(cursor)
+            self._edit_range(patch)
         finally:
-            self.text.blockSignals(False)
             self.applying_remote = False
 
+    def _set_version(self, version: int) -> None:
         self.current_version = version
         self.lbl_version.setText(f"ver: {self.current_version}")
-        self.doc_synced = True
 
-    def _cursor_after_patch(self, old_pos: int, patch: Dict[str, Any]) -> int:
-        try:
-            pos = int(patch.get("pos", 0))
-        except (TypeError, ValueError):
-            return old_pos
+    def _edit_range(self, patch: Dict[str, Any]) -> None:
+        """패치가 가리키는 [pos, pos+len) 구간만 QTextCursor로 교체."""
         ptype = patch.get("type")
-        if ptype == "INSERT":
-            text = patch.get("text", "")
-            added = len(text) if isinstance(text, str) else 0
-            if old_pos < pos:
-                return old_pos
-            return old_pos + added
-        if ptype == "DELETE":
-            length = self._patch_length(patch)
-            if old_pos <= pos:
-                return old_pos
-            if old_pos <= pos + length:
-                return pos
-            return old_pos - length
-        if ptype == "REPLACE":
-            length = self._patch_length(patch)
-            text = patch.get("text", "")
-            added = len(text) if isinstance(text, str) else 0
-            if old_pos <= pos:
-                return old_pos
-            if old_pos <= pos + length:
-                return pos + added
-            delta = added - length
-            return old_pos + delta
-        return old_pos
+        pos = int(patch.get("pos", 0))
+        length = self._patch_length(patch) if ptype in ("DELETE", "REPLACE") else 0
+        text = patch.get("text", "") if ptype in ("INSERT", "REPLACE") else ""
+        document = self.text.document()
+        # 원격 편집은 로컬 실행 취소 기록에 남기지 않음 (Ctrl+Z가 다른 사용자의 편집을 되돌려
+        # 로컬 편집으로 전송하지 않도록). 끄면 쌓인 기록도 지워지며, setPlainText 때와 같은 동작
+        document.setUndoRedoEnabled(False)
+        edit = QtGui.QTextCursor(document)
+        edit.beginEditBlock()
+        try:
+            edit.setPosition(pos)
+            if length:
+                edit.setPosition(pos + length, QtGui.QTextCursor.KeepAnchor)
+                edit.removeSelectedText()
+            if isinstance(text, str) and text:
+                edit.insertText(text)
+        finally:
+            edit.endEditBlock()
+            document.setUndoRedoEnabled(True)
 
     def _patch_length(self, patch: Dict[str, Any]) -> int:
         value = patch.get("len", patch.get("length", 0))
@@ -2,12 +2,96 @@
 
 from __future__ import annotations
 
+import itertools
 import threading
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Dict, Optional, Set, Tuple
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
 
 
 VALID_EDIT_OPS = {"INSERT", "DELETE", "REPLACE"}
+ROPE_CHUNK_SIZE = 4096  # 로프 청크 최대 글자 수
+OPS_HISTORY_LIMIT = 1000  # GET_OPS로 돌려줄 수 있는 최근 연산 수
+
+
+class Rope:
+    """최대 ROPE_CHUNK_SIZE 글자 청크 리스트로 텍스트를 보관하는 간단한 로프.
+
+    삽입/삭제는 해당 위치의 청크만 다시 만들기 때문에 편집마다
+    문서 전체 문자열을 복사하지 않는다. 범위 검증은 호출 측 책임.
+    """
+
+    __slots__ = ("_chunks", "_length")
+
+    def __init__(self, text: str = "") -> None:
+        self._chunks: List[str] = _split_chunks(text)
+        self._length = len(text)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return "".join(self._chunks)
+
+    def __repr__(self) -> str:
+        return f"Rope(len={self._length}, chunks={len(self._chunks)})"
+
+    def insert(self, pos: int, text: str) -> None:
+        if not text:
+            return
+        if not self._chunks:
+            self._chunks = _split_chunks(text)
+            self._length = len(text)
+            return
+        idx, off = self._locate(pos)
+        chunk = self._chunks[idx]
+        merged = chunk[:off] + text + chunk[off:]
+        if len(merged) <= ROPE_CHUNK_SIZE:
+            self._chunks[idx] = merged
+        else:
+            self._chunks[idx : idx + 1] = _split_chunks(merged)
+        self._length += len(text)
+
+    def delete(self, pos: int, length: int) -> None:
+        if length <= 0:
+            return
+        chunks = self._chunks
+        first, off = self._locate(pos)
+        idx = first
+        remaining = length
+        while remaining:
+            chunk = chunks[idx]
+            take = min(len(chunk) - off, remaining)
+            rest = chunk[:off] + chunk[off + take :]
+            remaining -= take
+            if rest:
+                chunks[idx] = rest
+                idx += 1
+            else:
+                del chunks[idx]
+            off = 0
+        self._length -= length
+        self._merge_small(first)
+
+    def replace(self, pos: int, length: int, text: str) -> None:
+        self.delete(pos, length)
+        self.insert(pos, text)
+
+    def _locate(self, pos: int) -> Tuple[int, int]:
+        """pos가 속한 (청크 인덱스, 청크 내 오프셋). 경계는 앞 청크의 끝으로 본다."""
+        for idx, chunk in enumerate(self._chunks):
+            size = len(chunk)
+            if pos <= size:
+                return idx, pos
+            pos -= size
+        raise IndexError("rope position out of range")
+
+    def _merge_small(self, idx: int) -> None:
+        """삭제로 작아진 청크를 이웃과 합쳐 청크 수가 늘어나지 않게 함."""
+        chunks = self._chunks
+        for i in (idx, idx - 1):
+            if 0 <= i < len(chunks) - 1 and len(chunks[i]) + len(chunks[i + 1]) <= ROPE_CHUNK_SIZE:
+                chunks[i : i + 2] = [chunks[i] + chunks[i + 1]]
 
 
 @dataclass
@@ -15,98 +99,192 @@ class DocState:
     """단일 문서의 내용/버전/구독자 상태."""
 
     id: str
-    content: str = ""
+    content: Rope = field(default_factory=Rope)
     version: int = 0
     subscribers: Set[str] = field(default_factory=set)
+    # 브로드캐스트용 구독자 튜플. 구독/해지 때만 새로 만들어 브로드캐스트는 잠금/복사 없이 읽음
+    subscribers_view: Tuple[str, ...] = field(default=(), repr=False)
     lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    history: Deque[Dict[str, object]] = field(
+        default_factory=lambda: deque(maxlen=OPS_HISTORY_LIMIT), repr=False
+    )
+    _text: Optional[str] = field(default=None, repr=False)
+    _text_version: int = field(default=-1, repr=False)
+    # (version, 인코딩된 DOC_SNAPSHOT 프레임). 허브가 채우고 버전이 다르면 무시한다.
+    snapshot_frame: Optional[Tuple[int, bytes]] = field(default=None, repr=False)
+
+    def text(self) -> str:
+        """로프 내용을 문자열로 합쳐 반환.
+
+        편집은 로프만 갱신하고 문자열은 스냅샷이 필요할 때만 만든다.
+        버전이 그대로면 이전에 만든 문자열을 재사용한다.
+        """
+        if self._text is None or self._text_version != self.version:
+            self._text = str(self.content)
+            self._text_version = self.version
+        return self._text
+
+    def add_subscriber(self, sid: str) -> None:
+        """구독자 추가 (lock 안에서 호출)."""
+        if sid not in self.subscribers:
+            self.subscribers.add(sid)
+            self.subscribers_view = tuple(self.subscribers)
+
+    def remove_subscriber(self, sid: str) -> None:
+        """구독자 제거 (lock 안에서 호출)."""
+        if sid in self.subscribers:
+            self.subscribers.discard(sid)
+            self.subscribers_view = tuple(self.subscribers)
+
+    def record_op(self, patch: Dict[str, object], by: str) -> None:
+        """현재 version으로 확정된 패치를 최근 연산 기록에 추가."""
+        self.history.append({"version": self.version, "patch": patch, "by": by})
+
+    def ops_since(self, since: int) -> Optional[List[Dict[str, object]]]:
+        """since 이후 확정된 연산 목록. 기록이 남아 있지 않으면 None."""
+        if since == self.version:
+            return []
+        if since > self.version or not self.history:
+            return None
+        first = int(self.history[0]["version"])
+        if since + 1 < first:
+            return None
+        return list(itertools.islice(self.history, since + 1 - first, None))
 
     def snapshot_payload(self) -> Dict[str, object]:
         return {
             "docId": self.id,
             "version": self.version,
-            "content": self.content,
+            "content": self.text(),
         }
 
 
 def apply_operation(
-    content: str, message: Dict[str, object]
-) -> Tuple[bool, str, Optional[Dict[str, object]], str]:
-    """클라이언트 연산을 적용하고 결과/패치를 반환."""
-    op = str(message.get("op", "")).upper()
-    if op not in VALID_EDIT_OPS:
+    content: Rope, message: Dict[str, object]
+) -> Tuple[bool, Rope, Optional[Dict[str, object]], str]:
+    """클라이언트 연산을 로프에 제자리 적용하고 결과/패치를 반환."""
+    handler = _lookup(_EDIT_HANDLERS, message.get("op"))
+    if handler is None:
         return False, content, None, "INVALID_OP"
 
-    try:
-        pos = int(message.get("pos", 0))
-    except (TypeError, ValueError):
+    size = len(content)
+    pos = message.get("pos", 0)
+    if type(pos) is not int:
+        # 정수로 온 경우(정상 클라이언트)는 변환 없이 그대로 사용
+        try:
+            pos = int(pos)
+        except (TypeError, ValueError):
+            return False, content, None, "INVALID_RANGE"
+
+    if pos < 0 or pos > size:
         return False, content, None, "INVALID_RANGE"
+    return handler(content, message, pos, size)
 
-    if pos < 0 or pos > len(content):
+
+def _edit_insert(content: Rope, message: Dict[str, object], pos: int, size: int):
+    text = message.get("text", "")
+    if not isinstance(text, str):
+        return False, content, None, "INVALID_PAYLOAD"
+    content.insert(pos, text)
+    return True, content, {"type": "INSERT", "pos": pos, "text": text}, ""
+
+
+def _edit_delete(content: Rope, message: Dict[str, object], pos: int, size: int):
+    length = _message_length(message)
+    if length < 0 or pos + length > size:
         return False, content, None, "INVALID_RANGE"
+    content.delete(pos, length)
+    return True, content, {"type": "DELETE", "pos": pos, "len": length}, ""
 
-    if op == "INSERT":
-        text = message.get("text", "")
-        if not isinstance(text, str):
-            return False, content, None, "INVALID_PAYLOAD"
-        new_content = content[:pos] + text + content[pos:]
-        patch = {"type": "INSERT", "pos": pos, "text": text}
-        return True, new_content, patch, ""
 
-    if op == "DELETE":
-        try:
-            length = _coerce_length(message.get("len"))
-        except ValueError:
-            return False, content, None, "INVALID_RANGE"
-        if pos + length > len(content):
-            return False, content, None, "INVALID_RANGE"
-        new_content = content[:pos] + content[pos + length :]
-        patch = {"type": "DELETE", "pos": pos, "len": length}
-        return True, new_content, patch, ""
-
-    # REPLACE
-    try:
-        length = _coerce_length(message.get("len"))
-    except ValueError:
+def _edit_replace(content: Rope, message: Dict[str, object], pos: int, size: int):
+    length = _message_length(message)
+    if length < 0:
         return False, content, None, "INVALID_RANGE"
     text = message.get("text", "")
     if not isinstance(text, str):
         return False, content, None, "INVALID_PAYLOAD"
-    if pos + length > len(content):
+    if pos + length > size:
         return False, content, None, "INVALID_RANGE"
-    new_content = content[:pos] + text + content[pos + length :]
-    patch = {"type": "REPLACE", "pos": pos, "len": length, "text": text}
-    return True, new_content, patch, ""
+    content.replace(pos, length, text)
+    return True, content, {"type": "REPLACE", "pos": pos, "len": length, "text": text}, ""
+
+
+def _message_length(message: Dict[str, object]) -> int:
+    """요청의 len을 정수로 반환. 없거나 음수/잘못된 값이면 -1."""
+    length = message.get("len")
+    if type(length) is not int:
+        try:
+            length = _coerce_length(length)
+        except (TypeError, ValueError):
+            return -1
+    return length if length >= 0 else -1
 
 
-def apply_patch_dict(content: str, patch: Dict[str, object]) -> str:
-    """영속화 로그 등에 기록된 패치를 재적용."""
-    ptype = str(patch.get("type", "")).upper()
+def apply_patch_dict(content: Rope, patch: Dict[str, object]) -> Rope:
+    """영속화 로그 등에 기록된 패치를 로프에 제자리 재적용."""
+    ptype = patch.get("type", "")
+    handler = _lookup(_PATCH_HANDLERS, ptype)
     pos = int(patch.get("pos", 0))
     if pos < 0 or pos > len(content):
         raise ValueError("patch position out of range")
+    if handler is None:
+        raise ValueError(f"unsupported patch type: {ptype}")
+    handler(content, patch, pos)
+    return content
+
+
+def _patch_insert(content: Rope, patch: Dict[str, object], pos: int) -> None:
+    text = patch.get("text", "")
+    if not isinstance(text, str):
+        raise ValueError("invalid insert payload")
+    content.insert(pos, text)
+
+
+def _patch_delete(content: Rope, patch: Dict[str, object], pos: int) -> None:
+    length = _coerce_length(patch.get("len"))
+    if pos + length > len(content):
+        raise ValueError("delete length overflow")
+    content.delete(pos, length)
+
+
+def _patch_replace(content: Rope, patch: Dict[str, object], pos: int) -> None:
+    length = _coerce_length(patch.get("len"))
+    text = patch.get("text", "")
+    if not isinstance(text, str):
+        raise ValueError("invalid replace payload")
+    if pos + length > len(content):
+        raise ValueError("replace length overflow")
+    content.replace(pos, length, text)
+
+
+def _case_variants(handlers: Dict[str, Callable]) -> Dict[str, Callable]:
+    """대/소/첫글자 대문자 키를 미리 등록해 연산마다 upper() 문자열 생성을 피함."""
+    table: Dict[str, Callable] = {}
+    for name, fn in handlers.items():
+        for key in (name, name.lower(), name.capitalize()):
+            table[key] = fn
+    return table
+
+
+def _lookup(table: Dict[str, Callable], name: object) -> Optional[Callable]:
+    handler = table.get(name) if isinstance(name, str) else None
+    if handler is None and name:
+        # 미리 등록하지 않은 혼합 대소문자 등은 기존처럼 upper()로 정규화
+        handler = table.get(str(name).upper())
+    return handler
 
-    if ptype == "INSERT":
-        text = patch.get("text", "")
-        if not isinstance(text, str):
-            raise ValueError("invalid insert payload")
-        return content[:pos] + text + content[pos:]
 
-    if ptype == "DELETE":
-        length = _coerce_length(patch.get("len"))
-        if pos + length > len(content):
-            raise ValueError("delete length overflow")
-        return content[:pos] + content[pos + length :]
+_EDIT_HANDLERS = _case_variants(
+    {"INSERT": _edit_insert, "DELETE": _edit_delete, "REPLACE": _edit_replace}
+)
+_PATCH_HANDLERS = _case_variants(
+    {"INSERT": _patch_insert, "DELETE": _patch_delete, "REPLACE": _patch_replace}
+)
 
-    if ptype == "REPLACE":
-        length = _coerce_length(patch.get("len"))
-        text = patch.get("text", "")
-        if not isinstance(text, str):
-            raise ValueError("invalid replace payload")
-        if pos + length > len(content):
-            raise ValueError("replace length overflow")
-        return content[:pos] + text + content[pos + length :]
 
-    raise ValueError(f"unsupported patch type: {ptype}")
+def _split_chunks(text: str) -> List[str]:
+    return [text[i : i + ROPE_CHUNK_SIZE] for i in range(0, len(text), ROPE_CHUNK_SIZE)]
 
 
 def _coerce_length(value: Optional[object]) -> int:
@@ -120,6 +298,7 @@ def _coerce_length(value: Optional[object]) -> int:
 
 __all__ = [
     "DocState",
+    "Rope",
     "apply_operation",
     "apply_patch_dict",
 ]
\ No newline at end of file
@@ -8,14 +8,23 @@ import threading
 import time
 import uuid
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
-from .doc import DocState, apply_operation
-from .persist import append_oplog, ensure_storage, load_doc_content, save_snapshot
+from .doc import VALID_EDIT_OPS, DocState, apply_operation
+from .persist import OplogWriter, ensure_storage, load_doc_content
 from .protocol import ProtocolError, encode_message
 
 LOGGER = logging.getLogger(__name__)
 
+SEND_BATCH_MAX_BUFFERS = 512  # sendmsg 한 번에 넘길 최대 버퍼 수 (IOV_MAX 이하)
+SESSION_SHARDS = 16  # 세션 맵 잠금 분할 수
+MAX_PENDING_SEND_BYTES = 16 * 1024 * 1024  # 세션별 미전송 바이트 한도 (초과 시 느린 클라이언트로 보고 종료)
+WATCHDOG_INTERVAL = 10.0  # 하트비트 타임아웃이 꺼져 있을 때 워치독 주기(초)
+WATCHDOG_MIN_INTERVAL = 1.0  # 워치독 최소 대기(초)
+_MSG_MORE = getattr(socket, "MSG_MORE", 0)  # Linux 전용. 뒤에 보낼 데이터가 더 있음을 커널에 알림
+_APPLIED_PREFIX = b'{"ev":"APPLIED"'
+_BROADCAST_PREFIX = b'{"ev":"BROADCAST"'
+
 
 class Session:
     """TCP 세션 상태."""
@@ -28,19 +37,97 @@ class Session:
         self.hello_received = False
         self.alive = True
         self.subscriptions: set[str] = set()
-        self._writer_lock = threading.Lock()
+        # 송신 대기열: 보내지 못한 메시지를 순서대로 쌓아 두고 한 번의 시스템 콜로 묶어 보냄
+        self._pending: List[Union[bytes, memoryview]] = []
+        self._pending_bytes = 0
+        self._pending_lock = threading.Lock()
+        self._flushing = False  # 전송 중이거나 이벤트 루프에 전송이 예약된 상태
+        # 이벤트 루프가 설정하면 send_raw는 직접 보내지 않고 이 콜백으로 전송을 예약
+        self.on_pending: Optional[Callable[["Session"], None]] = None
         self.last_seen = time.monotonic()
 
     def send(self, payload: Dict[str, object]) -> None:
         if not self.alive:
             raise ConnectionError("session closed")
-        data = encode_message(payload)
-        with self._writer_lock:
+        self.send_raw(encode_message(payload))
+
+    def send_raw(self, data: bytes) -> None:
+        """이미 직렬화된 JSON line 바이트를 전송 대기열에 넣고 전송.
+
+        이미 전송 중(또는 예약됨)이면 대기열에만 넣고 반환하며, 쌓인 메시지는
+        전송하는 쪽이 한 번에 묶어 보낸다.
+        """
+        if not self.alive:
+            raise ConnectionError("session closed")
+        with self._pending_lock:
+            # 한도는 이 프레임 앞에 밀려 있는 바이트로만 판단 (맨 앞 전송 중 프레임 제외)
+            # → 한도보다 큰 스냅샷 한 건도 받아들이고, 그 뒤로 계속 쌓일 때만 느린 클라이언트로 봄
+            pending = self._pending
+            backlog = self._pending_bytes - len(pending[0]) if pending else 0
+            overflow = backlog > MAX_PENDING_SEND_BYTES
+            if overflow:
+                pending.clear()
+                self._pending_bytes = 0
+            else:
+                pending.append(data)
+                self._pending_bytes += len(data)
+                if self._flushing:
+                    return
+                self._flushing = True
+        if overflow:
+            self.close()
+            raise ConnectionError("send backlog exceeded")
+        if self.on_pending is not None:
+            self.on_pending(self)
+            return
+        self.flush()
+
+    def flush(self) -> bool:
+        """대기열을 보낼 수 있는 만큼 전송.
+
+        모두 보냈으면 True, 논블로킹 소켓 버퍼가 가득 차 남은 데이터가 있으면 False.
+        """
+        sock = self.socket
+        while True:
+            with self._pending_lock:
+                if not self._pending:
+                    self._flushing = False
+                    return True
+                batch = self._pending[:SEND_BATCH_MAX_BUFFERS]
+                # 이번 배치 뒤에 남은 프레임이 있으면 작은 세그먼트로 먼저 밀어내지 않도록 함
+                flags = _MSG_MORE if len(self._pending) > len(batch) else 0
             try:
-                self.socket.sendall(data)
+                if len(batch) > 1 and hasattr(sock, "sendmsg"):
+                    sent = sock.sendmsg(batch, (), flags)
+                else:
+                    sent = sock.send(batch[0] if len(batch) == 1 else b"".join(batch), flags)
+            except (BlockingIOError, InterruptedError):
+                return False
             except OSError as exc:
-                self.alive = False
+                with self._pending_lock:
+                    self._pending.clear()
+                    self._pending_bytes = 0
+                    self._flushing = False
+                self.close()
                 raise ConnectionError("send failed") from exc
+            with self._pending_lock:
+                self._consume(sent)
+
+    def _consume(self, sent: int) -> None:
+        """앞에서부터 sent 바이트만큼 대기열에서 제거 (_pending_lock 안에서 호출)."""
+        pending = self._pending
+        self._pending_bytes -= sent
+        done = 0
+        while sent and done < len(pending):
+            size = len(pending[done])
+            if sent < size:
+                # 큰 프레임이 여러 번에 걸쳐 나갈 때마다 나머지를 복사하지 않도록 뷰로 보관
+                head = pending[done]
+                pending[done] = (head if isinstance(head, memoryview) else memoryview(head))[sent:]
+                break
+            sent -= size
+            done += 1
+        del pending[:done]
 
     def close(self) -> None:
         if not self.alive:
@@ -60,6 +147,51 @@ class Session:
         self.last_seen = time.monotonic()
 
 
+class ShardedSessions:
+    """세션 ID 해시로 나눈 샤드마다 별도 잠금을 두는 세션 맵.
+
+    조회/등록/해제는 같은 샤드에 속한 세션끼리만 경쟁하고,
+    전체 순회는 샤드를 하나씩 잠가 모든 잠금을 동시에 잡지 않는다.
+    """
+
+    def __init__(self, shards: int = SESSION_SHARDS) -> None:
+        self._shards: List[Tuple[Dict[str, Session], threading.Lock]] = [
+            ({}, threading.Lock()) for _ in range(max(1, shards))
+        ]
+
+    def _shard(self, sid: str) -> Tuple[Dict[str, Session], threading.Lock]:
+        return self._shards[hash(sid) % len(self._shards)]
+
+    def get(self, sid: str) -> Optional[Session]:
+        sessions, lock = self._shard(sid)
+        with lock:
+            return sessions.get(sid)
+
+    def add(self, session: Session) -> None:
+        sessions, lock = self._shard(session.id)
+        with lock:
+            sessions[session.id] = session
+
+    def pop(self, sid: str) -> Optional[Session]:
+        sessions, lock = self._shard(sid)
+        with lock:
+            return sessions.pop(sid, None)
+
+    def __contains__(self, sid: object) -> bool:
+        return isinstance(sid, str) and self.get(sid) is not None
+
+    def __len__(self) -> int:
+        return sum(len(sessions) for sessions, _ in self._shards)
+
+    def values(self) -> List[Session]:
+        """모든 세션 목록 (샤드별로 잠깐씩 잠그고 복사)."""
+        result: List[Session] = []
+        for sessions, lock in self._shards:
+            with lock:
+                result.extend(sessions.values())
+        return result
+
+
 class ServerHub:
     """문서/세션간 메시지 라우팅을 담당."""
 
@@ -70,14 +202,20 @@ class ServerHub:
         oplog_dir: Path,
         snapshot_interval: int = 50,
         heartbeat_timeout: int = 120,
+        oplog_wait: bool = False,
     ) -> None:
         self.snapshot_dir, self.oplog_dir = ensure_storage(snapshot_dir, oplog_dir)
         self.snapshot_interval = max(1, snapshot_interval)
         self.heartbeat_timeout = heartbeat_timeout
-        self.sessions: Dict[str, Session] = {}
+        self.oplog = OplogWriter(self.oplog_dir, self.snapshot_dir)
+        # True면 이벤트 루프가 오플로그 기록 완료 후에 응답을 보냄 (내구성 ↑, 지연 ↑)
+        self.oplog_wait = oplog_wait
+        self.sessions = ShardedSessions()
         self.docs: Dict[str, DocState] = {}
-        self._sessions_lock = threading.Lock()
         self._docs_lock = threading.Lock()
+        # 로드된 문서 버전의 최댓값 (HELLO 응답용). 갱신만 잠그고 읽기는 잠그지 않음
+        self._max_version_value = 0
+        self._max_version_lock = threading.Lock()
         self._stop_event = threading.Event()
         self._watchdog_thread = threading.Thread(target=self._watchdog_loop, daemon=True)
         self._watchdog_thread.start()
@@ -86,31 +224,30 @@ class ServerHub:
     def new_session(self, sock: socket.socket, addr: tuple[str, int]) -> Session:
         sid = f"S-{uuid.uuid4().hex[:8]}"
         session = Session(sid, sock, addr)
-        with self._sessions_lock:
-            self.sessions[sid] = session
+        self.sessions.add(session)
         LOGGER.info("session connected: %s %s", sid, addr)
         return session
 
     def unregister_session(self, session: Session) -> None:
-        with self._sessions_lock:
-            self.sessions.pop(session.id, None)
+        self.sessions.pop(session.id)
         for doc_id in list(session.subscriptions):
             doc = self._get_doc_if_loaded(doc_id)
             if doc:
                 with doc.lock:
-                    doc.subscribers.discard(session.id)
+                    doc.remove_subscriber(session.id)
         session.close()
         LOGGER.info("session closed: %s", session.id)
 
     # ---------- 문서 접근 ----------
     def _get_doc_if_loaded(self, doc_id: str) -> Optional[DocState]:
-        with self._docs_lock:
-            return self.docs.get(doc_id)
+        # dict.get은 GIL 아래에서 원자적이고 문서는 완성된 뒤에만 등록되므로 잠그지 않음
+        return self.docs.get(doc_id)
 
     def get_doc(self, doc_id: str) -> DocState:
-        doc = self._get_doc_if_loaded(doc_id)
+        doc = self.docs.get(doc_id)
         if doc:
             return doc
+        # 생성 경로에서만 잠그고 다시 확인 (double-checked)
         with self._docs_lock:
             doc = self.docs.get(doc_id)
             if doc:
@@ -118,7 +255,8 @@ class ServerHub:
             content, version = load_doc_content(doc_id, self.snapshot_dir, self.oplog_dir)
             doc = DocState(doc_id, content, version)
             self.docs[doc_id] = doc
-            return doc
+        self._note_version(version)
+        return doc
 
     # ---------- 라우팅 ----------
     def route_message(self, session: Session, message: Dict[str, object]) -> None:
@@ -134,7 +272,9 @@ class ServerHub:
             self._handle_subscribe(session, message)
         elif op == "GET_SNAPSHOT":
             self._handle_snapshot(session, message)
-        elif op in {"INSERT", "DELETE", "REPLACE"}:
+        elif op == "GET_OPS":
+            self._handle_get_ops(session, message)
+        elif op in VALID_EDIT_OPS:
             self._handle_edit(session, message)
         elif op == "PING":
             self._safe_send(session, {"ev": "PONG"})
@@ -163,11 +303,10 @@ class ServerHub:
             return
         doc = self.get_doc(doc_id)
         with doc.lock:
-            doc.subscribers.add(session.id)
+            doc.add_subscriber(session.id)
+            frame, snapshot = self._snapshot_frame_locked(doc)
         session.subscriptions.add(doc_id)
-        snapshot = doc.snapshot_payload()
-        snapshot["ev"] = "DOC_SNAPSHOT"
-        self._safe_send(session, snapshot)
+        self._send_snapshot(session, doc, frame, snapshot)
 
     def _handle_snapshot(self, session: Session, message: Dict[str, object]) -> None:
         try:
@@ -176,9 +315,32 @@ class ServerHub:
             self.send_error(session, "INVALID_DOC", hint="docId required")
             return
         doc = self.get_doc(doc_id)
-        snapshot = doc.snapshot_payload()
-        snapshot["ev"] = "DOC_SNAPSHOT"
-        self._safe_send(session, snapshot)
+        # 내용과 버전이 같은 시점을 가리키도록 잠금 안에서 스냅샷 생성
+        with doc.lock:
+            frame, snapshot = self._snapshot_frame_locked(doc)
+        self._send_snapshot(session, doc, frame, snapshot)
+
+    def _handle_get_ops(self, session: Session, message: Dict[str, object]) -> None:
+        """since 이후 연산만 전송 (OUT_OF_DATE 클라이언트가 스냅샷 대신 보정에 사용)."""
+        try:
+            doc_id = self._normalize_doc_id(message.get("docId"))
+        except ValueError:
+            self.send_error(session, "INVALID_DOC", hint="docId required")
+            return
+        try:
+            since = int(message.get("since"))
+        except (TypeError, ValueError):
+            self.send_error(session, "INVALID_RANGE", hint="since required")
+            return
+        doc = self.get_doc(doc_id)
+        with doc.lock:
+            ops = doc.ops_since(since)
+            version = doc.version
+        if ops is None:
+            self.send_error(session, "OPS_UNAVAILABLE", docId=doc.id, serverVersion=version)
+            return
+        payload = {"ev": "OPS", "docId": doc.id, "since": since, "version": version, "ops": ops}
+        self._safe_send(session, payload)
 
     def _handle_edit(self, session: Session, message: Dict[str, object]) -> None:
         if not session.hello_received:
@@ -190,14 +352,18 @@ class ServerHub:
         except ValueError:
             self.send_error(session, "INVALID_DOC", hint="docId required")
             return
-        try:
-            base_version = int(message.get("base"))
-        except (TypeError, ValueError):
-            base_version = -1
+        base_version = message.get("base")
+        if type(base_version) is not int:
+            # JSON 숫자는 이미 int이므로 변환/예외 처리는 그 밖의 값일 때만
+            try:
+                base_version = int(base_version)
+            except (TypeError, ValueError):
+                base_version = -1
         doc = self.get_doc(doc_id)
         patch_result: Optional[Dict[str, object]] = None
         current_version: Optional[int] = None
         error_meta: Optional[tuple[str, Dict[str, object]]] = None
+        snapshot_text: Optional[str] = None
 
         with doc.lock:
             if base_version != doc.version:
@@ -212,11 +378,19 @@ class ServerHub:
                 else:
                     doc.content = new_content
                     doc.version += 1
+                    doc.record_op(patch, session.id)
                     patch_result = patch
                     current_version = doc.version
-                    append_oplog(doc.id, doc.version, patch, session.id, self.oplog_dir)
+                    self._note_version(current_version)
+                    self.oplog.append(doc.id, doc.version, patch, session.id)
                     if current_version % self.snapshot_interval == 0:
-                        save_snapshot(doc, self.snapshot_dir)
+                        snapshot_text = doc.text()
+
+        if snapshot_text is not None and current_version is not None:
+            # 내용은 잠금 안에서 확정하고, 파일 기록/fsync/압축은 오플로그 커밋 스레드가 처리
+            # (이벤트 루프는 디스크를 기다리지 않음. 큐 순서상 이 버전의 오플로그 기록 뒤에 실행됨)
+            self.oplog.sync(doc.id)
+            self.oplog.snapshot(doc.id, current_version, snapshot_text)
 
         if error_meta:
             code, extra = error_meta
@@ -233,43 +407,77 @@ class ServerHub:
             "patch": patch_result,
             "by": session.id,
         }
-        broadcast_event = dict(applied_event)
-        broadcast_event["ev"] = "BROADCAST"
-        self._safe_send(session, applied_event)
-        self._broadcast(doc, broadcast_event, exclude=session.id)
+        try:
+            data = encode_message(applied_event)
+        except ProtocolError as exc:
+            LOGGER.error("protocol encode failed: %s", exc)
+            return
+        self._safe_send_raw(session, data)
+        # BROADCAST는 ev 값만 다르므로 dict를 복사해 다시 직렬화하지 않고 앞부분만 바꿔 씀
+        # ("ev"가 첫 키라 직렬화 결과는 항상 _APPLIED_PREFIX로 시작)
+        self._broadcast_raw(doc, _BROADCAST_PREFIX + data[len(_APPLIED_PREFIX) :], exclude=session.id)
 
     # ---------- 헬퍼 ----------
     def _safe_send(self, session: Session, payload: Dict[str, object]) -> None:
         if not session.alive:
             return
         try:
-            session.send(payload)
-        except ConnectionError:
-            self.unregister_session(session)
+            data = encode_message(payload)
         except ProtocolError as exc:
             LOGGER.error("protocol encode failed: %s", exc)
+            return
+        self._safe_send_raw(session, data)
+
+    @staticmethod
+    def _snapshot_frame_locked(doc: DocState) -> Tuple[Optional[bytes], Optional[Dict[str, object]]]:
+        """doc.lock 안에서 호출. 현재 버전의 인코딩된 프레임이 있으면 그것을, 없으면 페이로드를 반환."""
+        cached = doc.snapshot_frame
+        if cached is not None and cached[0] == doc.version:
+            return cached[1], None
+        snapshot = doc.snapshot_payload()
+        snapshot["ev"] = "DOC_SNAPSHOT"
+        return None, snapshot
+
+    def _send_snapshot(
+        self, session: Session, doc: DocState, frame: Optional[bytes], snapshot: Optional[Dict[str, object]]
+    ) -> None:
+        # 같은 버전을 여러 세션이 요청해도 문서 전체 인코딩은 버전당 한 번만 한다
+        if frame is None:
+            try:
+                frame = encode_message(snapshot)
+            except ProtocolError as exc:
+                LOGGER.error("protocol encode failed: %s", exc)
+                return
+            doc.snapshot_frame = (int(snapshot["version"]), frame)
+        self._safe_send_raw(session, frame)
+
+    def _safe_send_raw(self, session: Session, data: bytes) -> None:
+        if not session.alive:
+            return
+        try:
+            session.send_raw(data)
+        except ConnectionError:
+            self.unregister_session(session)
 
     def send_error(self, session: Session, code: str, **extra: object) -> None:
         payload = {"ev": "ERROR", "code": code}
         payload.update(extra)
         self._safe_send(session, payload)
 
-    def _broadcast(self, doc: DocState, payload: Dict[str, object], *, exclude: Optional[str] = None) -> None:
-        with doc.lock:
-            targets = list(doc.subscribers)
-        for sid in targets:
+    def _broadcast_raw(self, doc: DocState, data: bytes, *, exclude: Optional[str] = None) -> None:
+        # 구독자 수와 무관하게 한 번 직렬화한 같은 바이트를 모든 세션에 전송
+        for sid in doc.subscribers_view:
             if sid == exclude:
                 continue
             session = self._get_session(sid)
             if not session:
                 with doc.lock:
-                    doc.subscribers.discard(sid)
+                    doc.remove_subscriber(sid)
                 continue
-            self._safe_send(session, payload)
+            self._safe_send_raw(session, data)
 
     def _get_session(self, sid: str) -> Optional[Session]:
-        with self._sessions_lock:
-            return self.sessions.get(sid)
+        return self.sessions.get(sid)
 
     def _normalize_doc_id(self, value: object) -> str:
         doc_id = str(value or "").strip()
@@ -278,22 +486,41 @@ class ServerHub:
         return doc_id
 
     def _max_version(self) -> int:
-        with self._docs_lock:
-            if not self.docs:
-                return 0
-            return max(doc.version for doc in self.docs.values())
+        return self._max_version_value
+
+    def _note_version(self, version: int) -> None:
+        if version <= self._max_version_value:
+            return
+        with self._max_version_lock:
+            if version > self._max_version_value:
+                self._max_version_value = version
 
     # ---------- 워치독 ----------
+    def _watchdog_interval(self) -> float:
+        """가장 먼저 만료될 세션까지 남은 시간의 절반만큼 대기 (최소 WATCHDOG_MIN_INTERVAL).
+
+        모든 세션이 건강하면 드물게 깨어나고, 만료가 가까우면 촘촘히 확인한다.
+        """
+        timeout = self.heartbeat_timeout
+        if not timeout:
+            return WATCHDOG_INTERVAL
+        earliest = None
+        for session in self.sessions.values():
+            if session.alive and (earliest is None or session.last_seen < earliest):
+                earliest = session.last_seen
+        if earliest is None:
+            return max(WATCHDOG_MIN_INTERVAL, timeout / 2)
+        return max(WATCHDOG_MIN_INTERVAL, (earliest + timeout - time.monotonic()) / 2)
+
     def _watchdog_loop(self) -> None:
-        while not self._stop_event.wait(10):
+        while not self._stop_event.wait(self._watchdog_interval()):
             now = time.monotonic()
             stale: list[Session] = []
-            with self._sessions_lock:
-                for session in list(self.sessions.values()):
-                    if not session.alive:
-                        stale.append(session)
-                    elif self.heartbeat_timeout and now - session.last_seen > self.heartbeat_timeout:
-                        stale.append(session)
+            for session in self.sessions.values():
+                if not session.alive:
+                    stale.append(session)
+                elif self.heartbeat_timeout and now - session.last_seen > self.heartbeat_timeout:
+                    stale.append(session)
             for session in stale:
                 LOGGER.info("session timeout: %s", session.id)
                 self.unregister_session(session)
@@ -301,13 +528,14 @@ class ServerHub:
     def shutdown(self) -> None:
         self._stop_event.set()
         self._watchdog_thread.join(timeout=1.0)
-        with self._sessions_lock:
-            sessions = list(self.sessions.values())
+        sessions = self.sessions.values()
         for session in sessions:
             self.unregister_session(session)
+        self.oplog.close()
 
 
 __all__ = [
     "ServerHub",
     "Session",
+    "ShardedSessions",
 ]
\ No newline at end of file
@@ -4,12 +4,20 @@ from __future__ import annotations
 
 import argparse
 import logging
+import selectors
+import signal
 import socket
-import threading
+import time
 from pathlib import Path
-from .hub import ServerHub
+from typing import Dict, List
+
+from .hub import ServerHub, Session
 from .protocol import JsonLineFramer, ProtocolError
 
+RECV_BUFFER_SIZE = 65536  # 한 번의 recv로 읽을 최대 바이트 수
+SELECT_TIMEOUT = 1.0  # 닫힌 세션 정리 주기(초)
+SOCKET_BUFFER_BYTES = 1 << 20  # 연결별 커널 송수신 버퍼 크기 (브로드캐스트 몰림 대비)
+
 
 def parse_args() -> argparse.Namespace:
     project_root = Path(__file__).resolve().parent.parent
@@ -21,37 +29,193 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--oplog-dir", type=Path, default=project_root / "oplogs", help="오플로그 저장 경로")
     parser.add_argument("--snapshot-interval", type=int, default=50, help="스냅샷 저장 주기(연산 수)")
     parser.add_argument("--heartbeat-timeout", type=int, default=120, help="세션 타임아웃(초)")
+    parser.add_argument("--busy-poll", action="store_true", help="셀렉터를 대기 없이 계속 폴링 (지연 ↓, CPU 한 코어 점유)")
+    parser.add_argument("--oplog-wait", action="store_true", help="오플로그 기록 완료 후 응답 전송 (default: 백그라운드 기록)")
     parser.add_argument("--log-level", default="INFO", help="로그 레벨 (DEBUG/INFO/...)")
     return parser.parse_args()
 
 
-def client_worker(hub: ServerHub, session) -> None:
-    framer = JsonLineFramer()
-    sock = session.socket
-    try:
-        while session.alive:
-            chunk = sock.recv(4096)
-            if not chunk:
-                break
+class _Connection:
+    """이벤트 루프에 등록된 클라이언트 연결 상태."""
+
+    __slots__ = ("fd", "session", "framer", "writing")
+
+    def __init__(self, fd: int, session: Session) -> None:
+        self.fd = fd
+        self.session = session
+        self.framer = JsonLineFramer()
+        self.writing = False  # 소켓 버퍼가 차서 WRITE 이벤트를 기다리는 중
+
+
+class EventLoop:
+    """selectors 기반 단일 스레드 이벤트 루프.
+
+    연결마다 스레드를 두지 않고 하나의 셀렉터(epoll 등)로 accept/recv/send를
+    처리한다. 메시지 처리 중 쌓인 송신 데이터는 루프 한 바퀴가 끝날 때
+    세션별로 한 번에 내보내고, 소켓 버퍼가 차면 WRITE 이벤트로 이어서 보낸다.
+    """
+
+    def __init__(self, hub: ServerHub, server_sock: socket.socket, *, busy_poll: bool = False) -> None:
+        self.hub = hub
+        self.server_sock = server_sock
+        # True면 select(0)으로 쉬지 않고 폴링해 깨어나는 지연을 없앰 (저지연 전용)
+        self.busy_poll = busy_poll
+        self.selector = selectors.DefaultSelector()
+        self._conns: Dict[int, _Connection] = {}
+        self._dirty: List[Session] = []  # 송신 대기열이 생긴 세션 (루프 끝에서 전송)
+        # 단일 스레드이므로 모든 연결이 수신 버퍼 하나를 재사용 (recv마다 bytes 할당 방지)
+        self._rxbuf = bytearray(RECV_BUFFER_SIZE)
+        self._rxview = memoryview(self._rxbuf)
+        self._messages: List[Dict[str, object]] = []  # framer.feed 결과를 담는 재사용 리스트
+        self._running = False
+
+    def run(self) -> None:
+        self.server_sock.setblocking(False)
+        self.selector.register(self.server_sock, selectors.EVENT_READ, None)
+        self._running = True
+        timeout = 0 if self.busy_poll else SELECT_TIMEOUT
+        next_sweep = 0.0
+        try:
+            while self._running:
+                events = self.selector.select(timeout)
+                if not events and self.busy_poll:
+                    time.sleep(0)  # 다른 스레드(오플로그 커밋, 워치독)에 GIL 양보
+                for key, mask in events:
+                    conn = key.data
+                    if conn is None:
+                        self._accept()
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        self._on_readable(conn)
+                    if mask & selectors.EVENT_WRITE:
+                        self._flush(conn.session)
+                if self.hub.oplog_wait and self._dirty:
+                    # 이번 바퀴에 확정된 편집이 오플로그에 기록된 뒤 응답 전송
+                    self.hub.oplog.flush()
+                self._flush_dirty()
+                # 연결 전체를 훑는 정리는 이벤트마다가 아니라 SELECT_TIMEOUT마다 한 번만 수행
+                # (루프가 직접 닫는 연결은 _close에서 바로 정리되고, 여기서는 워치독 등이 닫은 것만 거둠)
+                now = time.monotonic()
+                if now >= next_sweep:
+                    self._sweep_closed()
+                    next_sweep = now + SELECT_TIMEOUT
+        finally:
+            for conn in list(self._conns.values()):
+                self._forget(conn)
+            self.selector.close()
+
+    def stop(self) -> None:
+        self._running = False
+
+    # ---------- 연결 ----------
+    def _accept(self) -> None:
+        while True:
             try:
-                messages = framer.feed(chunk)
-            except ProtocolError as exc:
-                hub.send_error(session, "BAD_JSON", hint=str(exc))
-                break
-            for msg in messages:
-                if not isinstance(msg, dict):
-                    hub.send_error(session, "BAD_JSON", hint="message must be object")
-                    continue
+                sock, addr = self.server_sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                logging.warning("accept failed: %s", exc)
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for opt in (socket.SO_SNDBUF, socket.SO_RCVBUF):
                 try:
-                    hub.route_message(session, msg)
-                except Exception as exc:
-                    logging.exception("route_message failed: session=%s", session.id)
-                    hub.send_error(session, "SERVER_ERROR", hint=str(exc))
-                    break
-    except (ConnectionError, OSError):
-        pass
-    finally:
-        hub.unregister_session(session)
+                    sock.setsockopt(socket.SOL_SOCKET, opt, SOCKET_BUFFER_BYTES)
+                except OSError as exc:  # 커널 상한 등으로 거부되면 기본값 사용
+                    logging.debug("socket buffer option failed: %s", exc)
+            session = self.hub.new_session(sock, addr)
+            session.on_pending = self._schedule_flush
+            fd = sock.fileno()
+            stale = self._conns.get(fd)
+            if stale is not None:
+                # 다른 스레드(워치독)가 닫은 소켓의 fd가 재사용된 경우 이전 등록을 먼저 정리
+                self._forget(stale)
+            conn = _Connection(fd, session)
+            self._conns[fd] = conn
+            self.selector.register(fd, selectors.EVENT_READ, conn)
+
+    def _close(self, conn: _Connection) -> None:
+        self._forget(conn)
+        self.hub.unregister_session(conn.session)
+
+    def _forget(self, conn: _Connection) -> None:
+        """셀렉터/연결 목록에서만 제거 (세션 정리는 호출 측 책임)."""
+        if self._conns.get(conn.fd) is conn:
+            del self._conns[conn.fd]
+            try:
+                self.selector.unregister(conn.fd)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def _sweep_closed(self) -> None:
+        """워치독 등 다른 경로로 종료된 세션을 셀렉터에서 제거."""
+        for conn in [c for c in self._conns.values() if not c.session.alive]:
+            self._forget(conn)
+            if conn.session.id in self.hub.sessions:
+                self.hub.unregister_session(conn.session)
+
+    # ---------- 수신 ----------
+    def _on_readable(self, conn: _Connection) -> None:
+        session = conn.session
+        if not session.alive:
+            self._close(conn)
+            return
+        try:
+            n = session.socket.recv_into(self._rxview)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(conn)
+            return
+        if not n:
+            self._close(conn)
+            return
+        messages = self._messages
+        try:
+            conn.framer.feed(self._rxview[:n], messages)
+        except ProtocolError as exc:
+            messages.clear()
+            self.hub.send_error(session, "BAD_JSON", hint=str(exc))
+            self._flush(session)
+            self._close(conn)
+            return
+        for msg in messages:
+            if not isinstance(msg, dict):
+                self.hub.send_error(session, "BAD_JSON", hint="message must be object")
+                continue
+            try:
+                self.hub.route_message(session, msg)
+            except Exception as exc:
+                logging.exception("route_message failed: session=%s", session.id)
+                self.hub.send_error(session, "SERVER_ERROR", hint=str(exc))
+                break
+        messages.clear()
+
+    # ---------- 송신 ----------
+    def _schedule_flush(self, session: Session) -> None:
+        self._dirty.append(session)
+
+    def _flush_dirty(self) -> None:
+        while self._dirty:
+            dirty, self._dirty = self._dirty, []
+            for session in dirty:
+                self._flush(session)
+
+    def _flush(self, session: Session) -> None:
+        conn = self._conns.get(session.socket.fileno()) if session.alive else None
+        if conn is None or conn.session is not session:
+            return
+        try:
+            done = session.flush()
+        except ConnectionError:
+            self._close(conn)
+            return
+        if done == conn.writing:
+            # 남은 데이터가 생기면 WRITE 대기 등록, 다 보내면 다시 READ만
+            conn.writing = not done
+            events = selectors.EVENT_READ | (0 if done else selectors.EVENT_WRITE)
+            self.selector.modify(conn.fd, events, conn)
 
 
 def run_server(args: argparse.Namespace) -> None:
@@ -65,32 +229,22 @@ def run_server(args: argparse.Namespace) -> None:
         oplog_dir=args.oplog_dir,
         snapshot_interval=args.snapshot_interval,
         heartbeat_timeout=args.heartbeat_timeout,
+        oplog_wait=args.oplog_wait,
     )
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_sock:
         server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_sock.bind((args.host, args.port))
         server_sock.listen(args.backlog)
-        server_sock.settimeout(1.0)
         logging.info("CollabServer listening on %s:%s", args.host, args.port)
 
-        stop_event = threading.Event()
+        loop = EventLoop(hub, server_sock, busy_poll=args.busy_poll)
+        # SIGTERM도 Ctrl+C처럼 정상 종료 (대기 중인 오플로그 기록을 마저 씀)
+        signal.signal(signal.SIGTERM, lambda *_: loop.stop())
         try:
-            while not stop_event.is_set():
-                try:
-                    conn, addr = server_sock.accept()
-                except socket.timeout:
-                    continue
-                except OSError:
-                    if stop_event.is_set():
-                        break
-                    raise
-                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-                session = hub.new_session(conn, addr)
-                threading.Thread(target=client_worker, args=(hub, session), daemon=True).start()
+            loop.run()
         except KeyboardInterrupt:
             logging.info("KeyboardInterrupt → shutting down")
-            stop_event.set()
         finally:
             hub.shutdown()
 
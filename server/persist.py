@@ -5,15 +5,39 @@ from __future__ import annotations
 import json
 import logging
 import os
+import queue
+import re
 import tempfile
+import threading
 import time
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from .doc import DocState, apply_patch_dict
+from .doc import Rope, apply_patch_dict
+
+try:
+    import orjson
+except ImportError:  # orjson 미설치 시 표준 json 모듈 사용
+    orjson = None
+
+# 오플로그 재생용 파서. orjson.JSONDecodeError는 json.JSONDecodeError의 하위 클래스라 예외 처리는 동일
+_json_loads = orjson.loads if orjson is not None else json.loads
 
 LOGGER = logging.getLogger(__name__)
 
+# 오플로그 한 줄의 최상위 version 값. 문자열 안의 따옴표는 이스케이프되므로
+# 처음 나오는 "version": 은 항상 엔트리 자신의 키다.
+_OPLOG_VERSION_RE = re.compile(rb'"version":\s*(\d+)')
+OPLOG_COMMIT_MAX_BATCH = 1024  # 커밋 스레드가 한 번에 모아 쓰는 최대 항목 수
+WRITEV_MAX_BUFFERS = 512  # writev 한 번에 넘길 최대 버퍼 수 (IOV_MAX 이하)
+_OPLOG_FLAGS = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+
+# 커밋 큐 제어 항목 (일반 기록은 None)
+_SYNC = object()
+_SNAPSHOT = object()
+_COMPACT = object()
+_STOP = object()
+
 
 def ensure_storage(snapshot_dir: Path, oplog_dir: Path) -> Tuple[Path, Path]:
     snapshot_dir.mkdir(parents=True, exist_ok=True)
@@ -21,47 +45,271 @@ def ensure_storage(snapshot_dir: Path, oplog_dir: Path) -> Tuple[Path, Path]:
     return snapshot_dir, oplog_dir
 
 
-def load_doc_content(doc_id: str, snapshot_dir: Path, oplog_dir: Path) -> Tuple[str, int]:
+def load_doc_content(doc_id: str, snapshot_dir: Path, oplog_dir: Path) -> Tuple[Rope, int]:
     """스냅샷과 오플로그를 적용하여 최신 내용을 반환."""
     snapshot_dir, oplog_dir = ensure_storage(snapshot_dir, oplog_dir)
-    content, version = _read_snapshot(doc_id, snapshot_dir)
-    content, version = _replay_oplog(doc_id, content, version, oplog_dir)
+    text, version = _read_snapshot(doc_id, snapshot_dir)
+    content, version = _replay_oplog(doc_id, Rope(text), version, oplog_dir)
     return content, version
 
 
-def save_snapshot(doc: DocState, snapshot_dir: Path) -> None:
-    """DocState를 스냅샷(JSON)으로 저장."""
+def save_snapshot(doc_id: str, version: int, content: str, snapshot_dir: Path) -> None:
+    """문서 내용을 스냅샷(JSON)으로 저장. 문서 잠금 밖에서 호출할 수 있도록 값을 받는다."""
     snapshot_dir.mkdir(parents=True, exist_ok=True)
-    path = snapshot_dir / f"{doc.id}.json"
+    path = snapshot_dir / f"{doc_id}.json"
     data = {
-        "docId": doc.id,
-        "version": doc.version,
-        "content": doc.content,
+        "docId": doc_id,
+        "version": version,
+        "content": content,
     }
-    tmp_fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, prefix=f".{doc.id}.", suffix=".tmp")
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, prefix=f".{doc_id}.", suffix=".tmp")
+    replaced = False
     try:
         with os.fdopen(tmp_fd, "w", encoding="utf-8") as fp:
             json.dump(data, fp, ensure_ascii=False, indent=2)
+            # 이후 오플로그를 이 버전까지 잘라내므로 교체 전에 디스크에 확정
+            fp.flush()
+            os.fsync(fp.fileno())
         os.replace(tmp_path, path)
-        LOGGER.debug("snapshot saved: %s v%s", doc.id, doc.version)
+        replaced = True
+        # 교체(rename) 자체도 디렉터리를 fsync해야 확정됨. 안 하면 크래시 후 옛 스냅샷과
+        # 이미 잘라낸 오플로그가 함께 남을 수 있음
+        _fsync_dir(snapshot_dir)
+        LOGGER.debug("snapshot saved: %s v%s", doc_id, version)
     finally:
-        if os.path.exists(tmp_path):
+        # 교체에 성공했으면 임시 파일은 이미 없으므로 stat 생략
+        if not replaced and os.path.exists(tmp_path):
             os.unlink(tmp_path)
 
 
-def append_oplog(doc_id: str, version: int, patch: Dict[str, object], by: str, oplog_dir: Path) -> None:
-    """오플로그(JSON Lines)에 패치 기록."""
-    oplog_dir.mkdir(parents=True, exist_ok=True)
-    entry = {
-        "docId": doc_id,
-        "version": version,
-        "patch": patch,
-        "by": by,
-        "ts": time.time(),
-    }
-    path = oplog_dir / f"{doc_id}.logl"
-    with path.open("a", encoding="utf-8") as fp:
-        fp.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+class OplogWriter:
+    """문서별 오플로그(JSON Lines)를 백그라운드 커밋 스레드로 묶어 기록 (group commit).
+
+    append()는 큐에 넣고 바로 반환하며, 커밋 스레드가 그동안 쌓인 항목을
+    문서별로 모아 writev 한 번으로 기록한다. fsync는 sync()로 요청한 시점에만 한다.
+    snapshot()은 스냅샷 파일 기록(fsync 포함)도 이 스레드에서 처리해 이벤트 루프를 막지 않고,
+    기록이 끝나면 스냅샷에 반영된 앞부분을 오플로그에서 잘라내 재생 길이를 스냅샷 간격 이내로 유지한다.
+    """
+
+    def __init__(
+        self,
+        oplog_dir: Path,
+        snapshot_dir: Optional[Path] = None,
+        *,
+        max_batch: int = OPLOG_COMMIT_MAX_BATCH,
+    ) -> None:
+        self.oplog_dir = oplog_dir
+        self.snapshot_dir = snapshot_dir
+        self._max_batch = max(1, max_batch)
+        self._queue: "queue.SimpleQueue[Tuple[object, str, object]]" = queue.SimpleQueue()
+        self._fds: Dict[str, int] = {}  # 커밋 스레드 전용
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._committed = 0
+        self._running = True  # 커밋 스레드가 끝나면 False (대기 중인 flush를 풀어 줌)
+        self._thread = threading.Thread(target=self._commit_loop, name="oplog-commit", daemon=True)
+        self._thread.start()
+
+    def append(self, doc_id: str, version: int, patch: Dict[str, object], by: str) -> None:
+        self._put(None, doc_id, _encode_oplog_entry(doc_id, version, patch, by))
+
+    def sync(self, doc_id: str) -> None:
+        """앞서 넣은 기록까지 디스크에 fsync하도록 요청 (스냅샷 시점 등, 기다리지 않음)."""
+        self._put(_SYNC, doc_id, b"")
+
+    def snapshot(self, doc_id: str, version: int, content: str) -> None:
+        """version 시점 내용을 스냅샷으로 저장한 뒤 오플로그를 압축하도록 요청 (기다리지 않음)."""
+        if self.snapshot_dir is None:
+            raise ValueError("snapshot_dir not configured")
+        self._put(_SNAPSHOT, doc_id, (version, content))
+
+    def compact(self, doc_id: str, version: int) -> None:
+        """version까지 스냅샷에 저장된 뒤 호출. 그 이하 기록을 오플로그에서 제거 (기다리지 않음)."""
+        self._put(_COMPACT, doc_id, version)
+
+    def flush(self) -> None:
+        """지금까지 넣은 항목이 모두 파일에 기록될 때까지 대기."""
+        with self._cond:
+            target = self._queued
+            # 커밋 스레드가 이미 끝났으면 기다려도 기록되지 않으므로 바로 반환
+            self._cond.wait_for(lambda: self._committed >= target or not self._running)
+
+    def close(self) -> None:
+        """남은 항목을 모두 기록한 뒤 커밋 스레드를 멈추고 파일을 닫음."""
+        if not self._thread.is_alive():
+            return
+        self._put(_STOP, "", b"")
+        self._thread.join()
+
+    def _put(self, kind: object, doc_id: str, data: object) -> None:
+        with self._cond:
+            self._queued += 1
+            self._queue.put((kind, doc_id, data))
+
+    def _commit_loop(self) -> None:
+        q = self._queue
+        try:
+            while True:
+                batch = [q.get()]
+                # 기록하는 동안 쌓인 항목을 한 번에 가져와 묶어서 씀
+                while len(batch) < self._max_batch:
+                    try:
+                        batch.append(q.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = self._commit(batch)
+                with self._cond:
+                    self._committed += len(batch)
+                    self._cond.notify_all()
+                if stop:
+                    break
+        finally:
+            for doc_id, fd in self._fds.items():
+                try:
+                    os.close(fd)
+                except OSError as exc:
+                    LOGGER.error("oplog close failed (%s): %s", doc_id, exc)
+            self._fds.clear()
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    def _commit(self, batch: List[Tuple[object, str, object]]) -> bool:
+        grouped: Dict[str, List[bytes]] = {}
+        stop = False
+        for kind, doc_id, data in batch:
+            if kind is None:
+                grouped.setdefault(doc_id, []).append(data)
+                continue
+            # 제어 항목 앞에 쌓인 기록을 먼저 내보내 순서를 지킴
+            self._write_grouped(grouped)
+            grouped = {}
+            if kind is _STOP:
+                stop = True
+                continue
+            # 항목 하나의 실패로 커밋 스레드가 죽으면 이후 기록이 모두 사라지므로 로그만 남기고 계속
+            try:
+                self._commit_control(kind, doc_id, data)
+            except Exception:
+                LOGGER.exception("oplog commit failed (%s)", doc_id)
+        self._write_grouped(grouped)
+        return stop
+
+    def _commit_control(self, kind: object, doc_id: str, data: object) -> None:
+        if kind is _SYNC:
+            fd = self._fds.get(doc_id)
+            if fd is not None:
+                try:
+                    os.fsync(fd)
+                except OSError as exc:
+                    LOGGER.error("oplog fsync failed (%s): %s", doc_id, exc)
+        elif kind is _SNAPSHOT:
+            version, content = data
+            try:
+                save_snapshot(doc_id, version, content, self.snapshot_dir)
+            except Exception:
+                # 인코딩 오류 등 무엇이든 실패하면 이 스냅샷만 포기하고 오플로그는 건드리지 않음
+                LOGGER.exception("snapshot save failed (%s v%s)", doc_id, version)
+            else:
+                self._compact(doc_id, version)
+        elif kind is _COMPACT:
+            self._compact(doc_id, data)
+
+    def _write_grouped(self, grouped: Dict[str, List[bytes]]) -> None:
+        for doc_id, bufs in grouped.items():
+            try:
+                fd = self._fds.get(doc_id)
+                if fd is None:
+                    self.oplog_dir.mkdir(parents=True, exist_ok=True)
+                    fd = os.open(self.oplog_dir / f"{doc_id}.logl", _OPLOG_FLAGS, 0o644)
+                    self._fds[doc_id] = fd
+                _write_all(fd, bufs)
+            except OSError as exc:
+                LOGGER.error("oplog write failed (%s): %s", doc_id, exc)
+            except Exception:
+                LOGGER.exception("oplog write failed (%s)", doc_id)
+
+    def _compact(self, doc_id: str, version: int) -> None:
+        # 열린 fd를 닫아 두면 다음 기록 때 새 파일을 다시 연다
+        fd = self._fds.pop(doc_id, None)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError as exc:
+                LOGGER.error("oplog close failed (%s): %s", doc_id, exc)
+        try:
+            _rewrite_oplog(self.oplog_dir / f"{doc_id}.logl", version)
+        except OSError as exc:
+            LOGGER.error("oplog compact failed (%s): %s", doc_id, exc)
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:  # 디렉터리를 열 수 없는 플랫폼(Windows)에서는 생략
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _rewrite_oplog(path: Path, version: int) -> None:
+    """version 이하 기록을 걸러낸 새 파일로 원자적으로 교체."""
+    if not path.exists():
+        return
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}.", suffix=".tmp")
+    replaced = False
+    try:
+        with os.fdopen(tmp_fd, "wb") as out, path.open("rb") as fp:
+            for line in fp:
+                match = _OPLOG_VERSION_RE.search(line)
+                if match is not None and int(match.group(1)) > version:
+                    out.write(line)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+        replaced = True
+        LOGGER.debug("oplog compacted: %s <= v%s", path.stem, version)
+    finally:
+        if not replaced and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def _write_all(fd: int, bufs: List[bytes]) -> None:
+    """버퍼 목록을 writev로 한 번에 기록 (부분 기록이면 나머지를 이어서 씀)."""
+    if len(bufs) > 1 and not hasattr(os, "writev"):
+        bufs = [b"".join(bufs)]
+    for i in range(0, len(bufs), WRITEV_MAX_BUFFERS):
+        chunk = bufs[i : i + WRITEV_MAX_BUFFERS]
+        written = os.writev(fd, chunk) if len(chunk) > 1 else os.write(fd, chunk[0])
+        total = sum(len(buf) for buf in chunk)
+        if written < total:
+            rest = memoryview(b"".join(chunk))[written:]
+            while rest:
+                rest = rest[os.write(fd, rest) :]
+
+
+def _json_bytes(obj: object) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _encode_oplog_entry(doc_id: str, version: int, patch: Dict[str, object], by: str) -> bytes:
+    # 항목 모양이 고정이므로 키 부분은 상수로 두고 값만 직렬화해 이어 붙임
+    # ({"docId","version","patch","by","ts"} 순서, 공백 없는 JSON 한 줄)
+    return b"".join(
+        (
+            b'{"docId":',
+            _json_bytes(doc_id),
+            b',"version":%d,"patch":' % version,
+            _json_bytes(patch),
+            b',"by":',
+            _json_bytes(by),
+            b',"ts":%r}\n' % time.time(),
+        )
+    )
 
 
 def _read_snapshot(doc_id: str, snapshot_dir: Path) -> Tuple[str, int]:
@@ -79,7 +327,7 @@ def _read_snapshot(doc_id: str, snapshot_dir: Path) -> Tuple[str, int]:
         return "", 0
 
 
-def _replay_oplog(doc_id: str, base_content: str, base_version: int, oplog_dir: Path) -> Tuple[str, int]:
+def _replay_oplog(doc_id: str, base_content: Rope, base_version: int, oplog_dir: Path) -> Tuple[Rope, int]:
     path = oplog_dir / f"{doc_id}.logl"
     if not path.exists():
         return base_content, base_version
@@ -87,35 +335,43 @@ def _replay_oplog(doc_id: str, base_content: str, base_version: int, oplog_dir:
     content = base_content
     version = base_version
     try:
-        with path.open("r", encoding="utf-8") as fp:
+        # 바이너리로 읽어 스냅샷에 이미 반영된 줄은 디코딩/JSON 파싱 없이 건너뜀
+        with path.open("rb") as fp:
             for line in fp:
-                line = line.strip()
-                if not line:
+                if line.isspace():
+                    continue
+                match = _OPLOG_VERSION_RE.search(line)
+                if match is not None and int(match.group(1)) <= version:
                     continue
                 try:
-                    entry = json.loads(line)
-                except json.JSONDecodeError:
+                    entry = _json_loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
                     LOGGER.warning("skip bad oplog line (%s)", doc_id)
                     continue
                 entry_version = int(entry.get("version", 0))
                 if entry_version <= version:
                     continue
+                if entry_version != version + 1:
+                    # 스냅샷보다 앞선 기록이 잘려 나간 경우 등. 건너뛰고 적용하면 내용이 어긋나므로 중단
+                    LOGGER.error("oplog gap (%s): v%s -> v%s, replay stopped", doc_id, version, entry_version)
+                    break
                 patch = entry.get("patch")
                 if not isinstance(patch, dict):
                     continue
                 try:
-                    content = apply_patch_dict(content, patch)
+                    apply_patch_dict(content, patch)
                 except Exception as exc:  # pragma: no cover (방어 코드)
                     LOGGER.error("oplog patch failed (%s v%s): %s", doc_id, entry_version, exc)
                     break
                 version = entry_version
     except FileNotFoundError:
-        return base_content, base_version
+        # 로프는 제자리 갱신되므로 지금까지 재적용한 상태(content/version 일치)를 반환
+        pass
     return content, version
 
 
 __all__ = [
-    "append_oplog",
+    "OplogWriter",
     "ensure_storage",
     "load_doc_content",
     "save_snapshot",
@@ -3,7 +3,12 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, List, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+try:
+    import orjson
+except ImportError:  # orjson 미설치 시 표준 json 모듈 사용
+    orjson = None
 
 
 MAX_MESSAGE_BYTES = 1_000_000  # 1MB 제한 (오용 방지)
@@ -18,44 +23,80 @@ class JsonLineFramer:
 
     def __init__(self, *, max_message_bytes: int = MAX_MESSAGE_BYTES) -> None:
         self._buffer = bytearray()
+        self._read_pos = 0  # 아직 처리하지 않은 줄의 시작
+        self._scan_pos = 0  # 개행을 이미 찾아본 위치 (긴 줄을 청크마다 다시 훑지 않도록)
         self._max_message_bytes = max_message_bytes
 
-    def feed(self, chunk: bytes) -> List[Dict[str, Any]]:
-        """새로운 바이트 청크를 넣고 완성된 메시지들을 반환."""
+    def feed(
+        self, chunk: Union[bytes, bytearray, memoryview], out: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, Any]]:
+        """새로운 바이트 청크를 넣고 완성된 메시지들을 반환.
+
+        chunk는 호출 측 수신 버퍼의 memoryview여도 되며, 반환 전에 내부 버퍼로 복사된다.
+        처리한 줄은 매번 버퍼에서 지우지 않고 읽기 위치만 옮긴 뒤, 절반 이상이
+        소비됐을 때 한 번에 당긴다. out을 넘기면 새 리스트 대신 그 리스트에 이어 붙여 반환한다.
+        """
+        messages: List[Dict[str, Any]] = [] if out is None else out
         if not chunk:
-            return []
-        self._buffer.extend(chunk)
-        if len(self._buffer) > self._max_message_bytes:
+            return messages
+        buf = self._buffer
+        buf += chunk
+        start = self._read_pos
+        if len(buf) - start > self._max_message_bytes:
             raise ProtocolError("message exceeds max size")
 
-        messages: List[Dict[str, Any]] = []
-        while True:
-            newline_index = self._buffer.find(b"\n")
-            if newline_index == -1:
-                break
-            line = self._buffer[:newline_index]
-            del self._buffer[: newline_index + 1]
-            line = line.strip()
-            if not line:
-                continue
-            messages.append(parse_json_line(line))
+        scan = self._scan_pos
+        scanned = False  # 버퍼 끝까지 개행을 찾아봤는지 (파싱 예외로 중간에 멈추면 False)
+        try:
+            while True:
+                newline_index = buf.find(b"\n", scan)
+                if newline_index == -1:
+                    scanned = True
+                    break
+                line = buf[start:newline_index]
+                start = scan = newline_index + 1
+                # JSON 파서가 앞뒤 공백(\r 포함)을 허용하므로 strip 복사 없이 빈 줄만 건너뜀
+                if line and not line.isspace():
+                    messages.append(parse_json_line(line))
+        finally:
+            # 예외로 빠져나왔으면 잘못된 줄 다음부터 다시 찾도록 scan을 start에 맞춤
+            scan = len(buf) if scanned else start
+            if start == len(buf):
+                buf.clear()
+                start = scan = 0
+            elif start > len(buf) // 2:
+                del buf[:start]
+                scan -= start
+                start = 0
+            self._read_pos = start
+            self._scan_pos = scan
         return messages
 
     def flush(self) -> None:
         """버퍼 초기화."""
         self._buffer.clear()
+        self._read_pos = self._scan_pos = 0
 
 
 def parse_json_line(line: bytes) -> Dict[str, Any]:
     """단일 JSON line을 dict로 파싱."""
     try:
+        if orjson is not None:
+            # orjson은 bytes를 직접 받으므로 decode 왕복 생략
+            return orjson.loads(line)
         return json.loads(line.decode("utf-8"))
-    except json.JSONDecodeError as exc:
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
         raise ProtocolError(f"bad json: {exc}") from exc
 
 
 def encode_message(obj: Dict[str, Any]) -> bytes:
     """dict를 JSON line 바이트로 직렬화."""
+    if orjson is not None:
+        try:
+            # orjson 출력은 이미 공백 없는 UTF-8 바이트
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+        except TypeError as exc:
+            raise ProtocolError(f"cannot encode message: {exc}") from exc
     try:
         payload = json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
     except (TypeError, ValueError) as exc: